@@ -1,5 +1,7 @@
 import json
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import helpers
+
+from technical.technicalCharts.elastic_client import get_es_client
 
 ES_INDEX = "indices"
 
@@ -21,7 +23,7 @@ mapping = {
 }
 
 # Local Elasticsearch instance without auth
-es = Elasticsearch("http://localhost:9200", verify_certs=False)
+es = get_es_client()
 
 
 def create_index():
@@ -1,8 +1,13 @@
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import helpers
 import pandas as pd
 
-ES = Elasticsearch("http://localhost:9200")
-SRC_INDEX = "nifty_data_weekly"
+from technical.technicalCharts import Constant
+from technical.technicalCharts.elastic_client import get_es_client
+
+ES = get_es_client()
+SRC_INDEX = Constant.timeframes["weekly"]["index_name"]
+# Set when SRC_INDEX is a read alias over yearly partitions (see technicalCharts/partitions.py)
+PARTITION_YEARS = Constant.timeframes["weekly"].get("partition_years")
 META_INDEX = "indices"
 BASE_VALUE = 1000.0
 
@@ -104,12 +109,24 @@ def calculate_equal_weight_index(df, ticker):
     return result
 
 
+def target_index(date):
+    """
+    Index a candle of `date` ("YYYY-MM-DD") is written to: the alias only
+    reads, so a partitioned SRC_INDEX is written per partition, named like
+    partitions.partition_index does.
+    """
+    if not PARTITION_YEARS:
+        return SRC_INDEX
+    year = int(date[:4])
+    return f"{SRC_INDEX}-{year - year % PARTITION_YEARS}"
+
+
 def index_custom_index(data):
     actions = []
     for d in data:
         doc_id = f"{d['ticker']}_{d['date']}"
         actions.append({
-            "_index": SRC_INDEX,
+            "_index": target_index(d["date"]),
             "_id": doc_id,
             "_source": d
         })
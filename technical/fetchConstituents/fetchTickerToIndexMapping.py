@@ -1,8 +1,8 @@
-from elasticsearch import Elasticsearch
+from technical.technicalCharts.elastic_client import get_es_client
 
 ES_INDEX = "indices"
 
-es = Elasticsearch("http://localhost:9200", verify_certs=False)
+es = get_es_client()
 
 def build_reverse_dict():
     reverse_dict = {}
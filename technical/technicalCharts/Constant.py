@@ -1,11 +1,101 @@
 host = "http://localhost:9200"
+# Shared Elasticsearch client (see elastic_client.py)
+es_connections_per_node = 10
+es_request_timeout = 60
+es_max_retries = 3
+es_http_compress = False
+# Bulk sink (see bulk_sink.py): chunks are cut at whichever limit is hit first
+bulk_chunk_size = 1000
+bulk_max_chunk_bytes = 10 * 1024 * 1024
+bulk_thread_count = 4
+bulk_queue_size = 4
+# Full rebuilds switch the index to bulk-load settings (see bulk_load.py)
+bulk_load = True
+bulk_load_forcemerge = False
+bulk_load_max_segments = 1
+bulk_load_forcemerge_timeout = 3600
+# Offline runs write gzipped NDJSON _bulk files here instead (see file_sink.py, replay.py)
+bulk_file_dir = "bulk_files"
+bulk_file_compresslevel = 3
 startDate = "2010-01-01"
 interval = "1d"
+# Mapping of newly created candle indices: "default" or "optimized" (see mappings.py)
+mapping_profile = "optimized"
 index_name = "nifty_data_weekly"
+state_index_name = "nifty_data_weekly_state"
 batch_size = 50
+# Local Parquet cache of daily OHLCV (see ohlcv_cache.py)
+use_cache = True
+cache_dir = "ohlcv_cache"
+cache_ttl_hours = 6
+# Relative Close change on an overlapping bar that means history was re-adjusted
+cache_adjust_tolerance = 1e-3
+# full_index downloads (see adaptive_fetch.py): batch_size is the first batch;
+# later ones shrink on failures or requests slower than fetch_target_seconds
+# and grow by fetch_batch_step while the error rate stays low
+fetch_min_batch_size = 5
+fetch_max_batch_size = 100
+fetch_batch_step = 5
+fetch_target_seconds = 30
+fetch_max_error_rate = 0.05
+# Symbols failing this many times (backoff doubling from fetch_retry_backoff_seconds)
+# are recorded in fetch_failures_path and skipped for fetch_failure_ttl_days
+fetch_max_attempts = 3
+fetch_retry_backoff_seconds = 30
+fetch_failures_path = "fetch_failures.json"
+fetch_failure_ttl_days = 7
+# full_index pipeline: fetched batches waiting for compute, computed tickers waiting for bulk
+pipeline_prefetch_batches = 1
+pipeline_ready_tickers = 16
+# Progress of fullIndexing.py runs, for --resume (see checkpoint.py)
+checkpoint_path = "full_index_checkpoint.json"
+# Processes computing indicators in full_index (1 = in-process; e.g.
+# os.cpu_count() once measured on the host). The panel engine gives every
+# worker at least panel_min_chunk_tickers tickers of a batch.
+workers = 1
+panel_min_chunk_tickers = 10
+# "panel" computes a whole batch as 2-D arrays, "ticker" one frame per ticker
+engine = "panel"
+# full_index keeps prices and indicators as float32 (about 7 significant
+# digits in the documents), e.g. to raise batch_size; see data_fetcher.downcast_prices
+low_memory = False
 rsi_window = 14
 atr_period = 14
 roc_period = 20
+# Candle timeframes indexed from one daily download (see timeframes.py).
+# Windows are counted in candles; unset ones use the values above.
+# partition_years (opt-in, e.g. 1) splits the candle index into partitions of
+# that many years behind a read alias of the same name (see partitions.py);
+# set it only once `python partitions.py migrate` has run for the timeframe.
+timeframes = {
+    "daily": {
+        "anchor": "D",
+        "index_name": "nifty_data_daily",
+        "state_index_name": "nifty_data_daily_state",
+        "high_low_window": 252
+    },
+    "weekly": {
+        "anchor": "W",
+        "index_name": index_name,
+        "state_index_name": state_index_name,
+        "high_low_window": 52
+    },
+    "monthly": {
+        "anchor": "M",
+        "index_name": "nifty_data_monthly",
+        "state_index_name": "nifty_data_monthly_state",
+        "high_low_window": 12
+    }
+}
+# `partitions.py seal` leaves partitions that ended less than this long ago writable
+partition_seal_after_days = 31
+# Timeframes a full_index run builds by default
+full_index_timeframes = ["daily", "weekly", "monthly"]
+# Benchmark symbol -> document field holding its ROC (see benchmarks.py)
+benchmarks = {
+    "^NSEI": "roc_nifty",
+    "^CRSLDX": "roc_nifty500"
+}
 nifty500 = [
     "360ONE.NS",
     "3MINDIA.NS",
@@ -0,0 +1,218 @@
+"""
+Adaptive download of the daily bars of a full_index run.
+
+A yfinance request that fails loses every symbol in it. AdaptiveFetcher
+instead:
+- sizes its batches from what it observes: halves them after a batch
+  with failed symbols (raised, or came back without data: yf.download
+  leaves those out rather than raising), scales them down when a request
+  takes longer than Constant.fetch_target_seconds, and grows them
+  otherwise while the error rate stays low (between fetch_min_batch_size
+  and fetch_max_batch_size)
+- bisects a failed request until the failing symbols stand alone, so the
+  rest of the batch is still fetched
+- retries failing symbols (errors, or no data) in later batches with
+  exponential backoff
+- records the symbols that failed every attempt in
+  Constant.fetch_failures_path; later runs skip them for
+  fetch_failure_ttl_days (delete the file to retry them sooner)
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import Constant
+from data_fetcher import combine_frames, fetch_frames
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Weight of the latest batch in the error rate
+_ERROR_RATE_WEIGHT = 0.2
+
+
+class FailedSymbols:
+    """
+    Symbols that failed every attempt of a run, persisted as JSON
+    {symbol: {"reason", "attempts", "failed_at"}} and skipped until they
+    are `ttl_days` old. Without a path nothing is persisted.
+    """
+
+    def __init__(self, path=None, ttl_days=None):
+        self.path = path
+        self.ttl = timedelta(days=Constant.fetch_failure_ttl_days if ttl_days is None else ttl_days)
+        self.symbols = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.symbols = json.load(f)
+
+    def skip(self, tickers):
+        """
+        (tickers to fetch, tickers skipped for a recent permanent failure).
+        """
+        cutoff = datetime.now() - self.ttl
+        skipped = [
+            t for t in tickers
+            if t in self.symbols and datetime.fromisoformat(self.symbols[t]["failed_at"]) > cutoff
+        ]
+        if skipped:
+            logger.info(f"Skipping {len(skipped)} symbols that failed before (see {self.path}): {skipped}")
+        skipped_set = set(skipped)
+        return [t for t in tickers if t not in skipped_set], skipped
+
+    def record(self, symbol, reason, attempts):
+        self.symbols[symbol] = {
+            "reason": reason, "attempts": attempts, "failed_at": datetime.now().isoformat(timespec="seconds")
+        }
+        self.save()
+
+    def clear(self, symbols):
+        """
+        Forgets symbols that came back with data.
+        """
+        if any(s in self.symbols for s in symbols):
+            for s in symbols:
+                self.symbols.pop(s, None)
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.symbols, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+class AdaptiveFetcher:
+    """
+    Yields the daily bars of a list of tickers batch by batch, see the
+    module docstring. `wait(seconds)` sleeps until a retry is due and
+    stops the fetch when it returns True (e.g. threading.Event.wait of a
+    pipeline's stop event). Symbols that failed for good end up in
+    `failed` ({symbol: reason}).
+    """
+
+    def __init__(self, start_date, end_date, batch_size=None, use_cache=None, failures=None,
+                 wait=time.sleep, clock=time.monotonic):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.use_cache = use_cache
+        self.failures = failures if failures is not None else FailedSymbols(Constant.fetch_failures_path)
+        self.wait = wait
+        self.clock = clock
+
+        self.min_size = Constant.fetch_min_batch_size
+        self.max_size = Constant.fetch_max_batch_size
+        self.size = min(max(batch_size or Constant.batch_size, self.min_size), self.max_size)
+        self.error_rate = 0.0
+
+        # symbol -> attempts so far, and when it may be retried
+        self.attempts = {}
+        self.due = {}
+        self.failed = {}
+
+    # ---------- batches ---------- #
+
+    def batches(self, tickers):
+        """
+        Yields (tickers with data, wide daily frame of them) until every
+        ticker was fetched or failed for good.
+        """
+        pending, _ = self.failures.skip(list(tickers))
+        pending.reverse()
+
+        while pending or self.due:
+            now = self.clock()
+            retries = sorted((t for t, due in self.due.items() if due <= now), key=self.due.get)[:self.size]
+            if not retries and not pending:
+                # Only symbols waiting for their backoff are left
+                if self.wait(min(self.due.values()) - now):
+                    return
+                continue
+
+            batch = retries + [pending.pop() for _ in range(min(self.size - len(retries), len(pending)))]
+            for t in retries:
+                del self.due[t]
+
+            started = self.clock()
+            frames, errors = self._fetch(batch)
+            # yf.download does not raise for a failed symbol, it leaves it out
+            failures = {t: errors.get(t, "no data") for t in batch if t not in frames}
+            self._tune(batch, self.clock() - started, failures)
+
+            for t in batch:
+                if t in failures:
+                    self._retry_or_fail(t, failures[t])
+                else:
+                    self.attempts.pop(t, None)
+
+            present = [t for t in batch if t in frames]
+            self.failures.clear(present)
+            if present:
+                yield present, combine_frames(frames, present, self.start_date, self.end_date)
+
+    def _fetch(self, tickers):
+        """
+        ({ticker: frame}, {ticker: error}) of one request; a failed request
+        is split in halves until the failing symbols stand alone.
+        """
+        try:
+            return fetch_frames(tickers, self.start_date, self.end_date, self.use_cache), {}
+        except Exception as e:
+            if len(tickers) == 1:
+                logger.warning(f"Download of {tickers[0]} failed: {e}")
+                return {}, {tickers[0]: f"{type(e).__name__}: {e}"}
+            logger.warning(f"Download of {len(tickers)} symbols failed ({e}), bisecting")
+
+        middle = len(tickers) // 2
+        frames, errors = self._fetch(tickers[:middle])
+        more_frames, more_errors = self._fetch(tickers[middle:])
+        return {**frames, **more_frames}, {**errors, **more_errors}
+
+    # ---------- failures ---------- #
+
+    def _retry_or_fail(self, symbol, reason):
+        attempts = self.attempts.get(symbol, 0) + 1
+        if attempts >= Constant.fetch_max_attempts:
+            logger.error(f"Giving up on {symbol} after {attempts} attempts: {reason}")
+            self.attempts.pop(symbol, None)
+            self.failed[symbol] = reason
+            self.failures.record(symbol, reason, attempts)
+            return
+
+        delay = Constant.fetch_retry_backoff_seconds * 2 ** (attempts - 1)
+        logger.info(f"Retrying {symbol} in {delay:.0f}s (attempt {attempts} failed: {reason})")
+        self.attempts[symbol] = attempts
+        self.due[symbol] = self.clock() + delay
+
+    # ---------- batch size ---------- #
+
+    def _tune(self, batch, seconds, failures):
+        """
+        Next batch size: halved after a batch with failed symbols (errors
+        or no data), scaled to the target time after a slow one, grown by
+        fetch_batch_step after a fast one while the error rate is low.
+        """
+        rate = len(failures) / len(batch)
+        self.error_rate = (1 - _ERROR_RATE_WEIGHT) * self.error_rate + _ERROR_RATE_WEIGHT * rate
+
+        size = self.size
+        if failures:
+            size = size // 2
+        elif seconds > Constant.fetch_target_seconds:
+            size = int(size * Constant.fetch_target_seconds / seconds)
+        elif self.error_rate < Constant.fetch_max_error_rate and len(batch) >= self.size:
+            size += Constant.fetch_batch_step
+        size = min(max(size, self.min_size), self.max_size)
+
+        if size != self.size:
+            logger.info(
+                f"Fetch batch size {self.size} -> {size} ({len(batch)} symbols in {seconds:.1f}s, "
+                f"{len(failures)} failed, error rate {self.error_rate:.2f})"
+            )
+        self.size = size
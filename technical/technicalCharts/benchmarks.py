@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import Constant
+from data_fetcher import fetch_data, resample
+from logging_config import get_logger
+from timeframes import WEEKLY
+
+logger = get_logger(__name__)
+
+# Document fields holding a benchmark ROC, in Constant.benchmarks order
+BENCHMARK_FIELDS = list(Constant.benchmarks.values())
+
+
+class Benchmark(NamedTuple):
+    """
+    Benchmark ROC prepared once per run: sorted unique candle dates and the
+    ROC on each of them, both read-only. Cheap to pickle into workers.
+    """
+    symbol: str
+    field: str
+    dates: np.ndarray
+    roc: np.ndarray
+
+    def lookup(self, dates):
+        """
+        ROC on each of `dates` (datetime64 array); 0.0 where the benchmark
+        has no candle, like the left merge + fillna it replaces.
+        """
+        dates = _as_datetime64(dates)
+        if len(self.dates) == 0:
+            return np.zeros(len(dates))
+
+        pos = np.searchsorted(self.dates, dates)
+        at = np.minimum(pos, len(self.dates) - 1)
+        hit = (pos < len(self.dates)) & (self.dates[at] == dates)
+        return np.where(hit, self.roc[at], 0.0)
+
+
+def _as_datetime64(dates):
+    return pd.DatetimeIndex(dates).to_numpy(dtype="datetime64[ns]")
+
+
+def prepare_benchmark(symbol, field, frame, period=Constant.roc_period):
+    """
+    Benchmark from a [Date, Close] frame of weekly candles. `frame` is not
+    modified. Weeks without a close are dropped; on duplicate dates the
+    last candle wins.
+    """
+    dates = pd.to_datetime(frame["Date"], errors="coerce")
+    close = pd.Series(frame["Close"].to_numpy(dtype=np.float64), index=dates)
+    close = close[close.index.notna() & close.notna()].sort_index(kind="stable")
+    close = close[~close.index.duplicated(keep="last")]
+
+    roc = (close.pct_change(periods=period, fill_method=None) * 100).fillna(0.0).to_numpy()
+    dates = _as_datetime64(close.index)
+    dates.flags.writeable = False
+    roc.flags.writeable = False
+    return Benchmark(symbol, field, dates, roc)
+
+
+def fetch_benchmarks(start_date=Constant.startDate, symbols=None):
+    """
+    Daily bars of every benchmark of Constant.benchmarks ({symbol: field})
+    in one download, as a wide frame; None when nothing was fetched.
+    """
+    symbols = symbols or Constant.benchmarks
+    end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    daily = fetch_data(list(symbols), start_date, end_date, to_weekly=False)
+    logger.info(f"benchmark data fetched from {start_date} to {end_date}")
+
+    if daily is None or daily.empty:
+        logger.warning("Benchmark data not fetched.")
+        return None
+    return daily
+
+
+def prepare_benchmarks(daily, timeframe=WEEKLY, symbols=None):
+    """
+    Benchmarks on `timeframe` candles from the daily bars of
+    fetch_benchmarks; returns a tuple of Benchmark, skipping unavailable ones.
+    """
+    symbols = symbols or Constant.benchmarks
+    if daily is None:
+        return ()
+
+    data = resample(daily, timeframe.anchor)
+    benchmarks = []
+    for symbol, field in symbols.items():
+        column = f"{symbol}/Close" if len(symbols) > 1 else f"Close/{symbol}"
+        if column not in data.columns:
+            logger.warning(f"Benchmark {symbol} not found in fetched data, {field} will be 0")
+            continue
+        frame = pd.DataFrame({"Date": data["Date"], "Close": data[column]})
+        benchmarks.append(prepare_benchmark(symbol, field, frame, timeframe.roc_period))
+    return tuple(benchmarks)
+
+
+def get_benchmarks(start_date=Constant.startDate, symbols=None, timeframe=WEEKLY):
+    """
+    fetch_benchmarks + prepare_benchmarks for a single timeframe.
+    """
+    return prepare_benchmarks(fetch_benchmarks(start_date, symbols), timeframe, symbols)
+
+
+def benchmark_columns(benchmarks, dates):
+    """
+    {field: ROC aligned on `dates`} for every configured benchmark field;
+    fields without a prepared benchmark are all 0.0.
+    """
+    dates = _as_datetime64(dates)
+    columns = {field: np.zeros(len(dates)) for field in BENCHMARK_FIELDS}
+    for benchmark in benchmarks or ():
+        columns[benchmark.field] = benchmark.lookup(dates)
+    return columns
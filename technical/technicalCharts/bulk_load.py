@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+
+import Constant
+from elastic_client import get_es_client
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Relaxed for the duration of a full load; replicas are rebuilt from the
+# primary afterwards instead of indexing every document twice
+BULK_LOAD_SETTINGS = {
+    "index.refresh_interval": "-1",
+    "index.translog.durability": "async",
+    "index.number_of_replicas": 0
+}
+
+
+def _current_settings(es, index_name):
+    """
+    {concrete index: current values of the BULK_LOAD_SETTINGS keys} for
+    `index_name` (an alias or pattern covers several indices); None for
+    the ones left at the ES default, so that restoring them resets to the
+    default.
+    """
+    resp = es.indices.get_settings(index=index_name, flat_settings=True)
+    return {
+        name: {key: body.get("settings", {}).get(key) for key in BULK_LOAD_SETTINGS}
+        for name, body in resp.items()
+    }
+
+
+@contextmanager
+def bulk_load(index_name, es=None, forcemerge=None):
+    """
+    Relaxes refresh, translog durability and replicas of `index_name` while
+    the block runs. The previous settings are always restored, also when
+    the load fails, to each index behind an alias separately; the index
+    is then refreshed and, after a successful load, optionally
+    force-merged to `Constant.bulk_load_max_segments`.
+    """
+    es = es or get_es_client()
+    if forcemerge is None:
+        forcemerge = Constant.bulk_load_forcemerge
+
+    previous = _current_settings(es, index_name)
+    logger.info(f"Bulk-load settings on {index_name} (was {previous})")
+    es.indices.put_settings(index=index_name, settings=BULK_LOAD_SETTINGS)
+
+    completed = False
+    try:
+        yield
+        completed = True
+    finally:
+        for name, settings in previous.items():
+            es.indices.put_settings(index=name, settings=settings)
+        es.indices.refresh(index=index_name)
+        logger.info(f"Restored settings on {index_name} and refreshed")
+
+        if completed and forcemerge:
+            logger.info(f"Force-merging {index_name} to {Constant.bulk_load_max_segments} segments")
+            es.options(request_timeout=Constant.bulk_load_forcemerge_timeout).indices.forcemerge(
+                index=index_name, max_num_segments=Constant.bulk_load_max_segments
+            )
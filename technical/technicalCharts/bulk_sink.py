@@ -0,0 +1,148 @@
+import threading
+import time
+
+import numpy as np
+from elasticsearch import helpers
+
+import Constant
+from elastic_client import get_es_client
+from logging_config import get_logger
+from metrics import METRICS
+
+logger = get_logger(__name__)
+
+
+def expand_action(action):
+    """
+    helpers.expand_action, except that the pre-encoded _source of an
+    update (serializer.update_actions) is sent as its body; the helper
+    would read it as source filtering.
+    """
+    if action.get("_op_type") == "update" and isinstance(action.get("_source"), bytes):
+        meta = {key: action[key] for key in ("_index", "_id") if key in action}
+        return {"update": meta}, action["_source"]
+    return helpers.expand_action(action)
+
+
+class _TimedClient:
+    """
+    Delegates to an Elasticsearch client and reports every bulk request
+    (one per chunk) to `record`.
+    """
+
+    def __init__(self, client, record):
+        self._client = client
+        self._record = record
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def options(self, **kwargs):
+        return _TimedClient(self._client.options(**kwargs), self._record)
+
+    def bulk(self, *args, operations, **kwargs):
+        start = time.perf_counter()
+        resp = self._client.bulk(*args, operations=operations, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        size = sum(len(line) + 1 for line in operations)
+        self._record(len(resp["items"]), size, elapsed, resp.get("took"), resp.get("errors", False))
+        return resp
+
+
+class BulkSink:
+    """
+    Bulk writer shared by every ticker of a run.
+
+    Chunks are cut at `chunk_size` documents or `max_chunk_bytes`, whichever
+    comes first, and sent by `thread_count` threads (parallel_bulk), or by
+    streaming_bulk with 429 retries when thread_count is 1. Every chunk's
+    latency and ES `took` are logged and kept for summary(), and recorded
+    in METRICS as the "bulk" stage.
+    """
+
+    def __init__(self, es=None, chunk_size=None, max_chunk_bytes=None, thread_count=None, queue_size=None):
+        self.es = es or get_es_client()
+        self.chunk_size = chunk_size or Constant.bulk_chunk_size
+        self.max_chunk_bytes = max_chunk_bytes or Constant.bulk_max_chunk_bytes
+        self.thread_count = thread_count or Constant.bulk_thread_count
+        self.queue_size = queue_size or Constant.bulk_queue_size
+
+        self.chunks = []
+        self._lock = threading.Lock()
+        self._client = _TimedClient(self.es, self._record)
+        self._started = None
+        self._labels = {}
+
+    def _record(self, docs, size, elapsed, took, errors):
+        with self._lock:
+            self.chunks.append({"docs": docs, "bytes": size, "seconds": elapsed, "took": took})
+            number = len(self.chunks)
+        METRICS.record("bulk", elapsed, self._labels, docs=docs, bytes=size, took_ms=took)
+        logger.info(
+            f"bulk chunk {number}: {docs} docs, {size / 1024:.0f} KiB in {elapsed * 1000:.0f} ms "
+            f"(took {took} ms{', with errors' if errors else ''})"
+        )
+
+    def send(self, actions):
+        """
+        Sends an iterable of bulk actions. Raises on the first failed
+        document, like helpers.bulk(raise_on_error=True).
+        Returns the number of documents written.
+        """
+        if self._started is None:
+            self._started = time.perf_counter()
+        # Chunks go out on parallel_bulk's threads; metrics label them with the caller's batch
+        self._labels = METRICS.labels()
+
+        if self.thread_count > 1:
+            results = helpers.parallel_bulk(
+                self._client, actions,
+                thread_count=self.thread_count,
+                queue_size=self.queue_size,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                expand_action_callback=expand_action,
+                raise_on_error=True
+            )
+        else:
+            results = helpers.streaming_bulk(
+                self._client, actions,
+                chunk_size=self.chunk_size,
+                max_chunk_bytes=self.max_chunk_bytes,
+                max_retries=Constant.es_max_retries,
+                expand_action_callback=expand_action,
+                raise_on_error=True
+            )
+
+        return sum(1 for ok, _ in results if ok)
+
+    def summary(self):
+        with self._lock:
+            chunks = list(self.chunks)
+        if not chunks:
+            return {"chunks": 0, "docs": 0, "bytes": 0}
+
+        latency = np.array([c["seconds"] for c in chunks]) * 1000
+        docs = sum(c["docs"] for c in chunks)
+        wall = time.perf_counter() - self._started
+        return {
+            "chunks": len(chunks),
+            "docs": docs,
+            "bytes": sum(c["bytes"] for c in chunks),
+            "latency_ms_p50": float(np.percentile(latency, 50)),
+            "latency_ms_p95": float(np.percentile(latency, 95)),
+            "latency_ms_max": float(latency.max()),
+            "docs_per_sec": docs / wall if wall > 0 else 0.0
+        }
+
+    def log_summary(self):
+        s = self.summary()
+        if not s["chunks"]:
+            logger.info("bulk sink: nothing sent")
+            return
+        logger.info(
+            f"bulk sink: {s['docs']} docs in {s['chunks']} chunks, {s['bytes'] / 1024 ** 2:.1f} MiB, "
+            f"latency p50 {s['latency_ms_p50']:.0f} ms / p95 {s['latency_ms_p95']:.0f} ms / "
+            f"max {s['latency_ms_max']:.0f} ms, {s['docs_per_sec']:.0f} docs/sec"
+        )
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from data_fetcher import to_arrays
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def fingerprints(daily_df, tickers):
+    """
+    {ticker: {"rows", "last_date", "sha1"}} over the daily OHLCV a batch
+    was computed from; tickers without data are left out.
+    """
+    out = {}
+    for ticker, arrays in to_arrays(daily_df, tickers).items():
+        close = arrays["Close"]
+        traded = np.flatnonzero(~np.isnan(close))
+        if len(traded) == 0:
+            continue
+
+        digest = hashlib.sha1(arrays["Date"].tobytes())
+        for field in ("Open", "High", "Low", "Close", "Volume"):
+            digest.update(np.ascontiguousarray(arrays[field]).tobytes())
+        out[ticker] = {
+            "rows": int(len(traded)),
+            "last_date": str(arrays["Date"][traded[-1]])[:10],
+            "sha1": digest.hexdigest()
+        }
+    return out
+
+
+class Checkpoint:
+    """
+    Durable progress of a full_index run, in a JSON file rewritten
+    atomically after every change:
+
+        {"run": {"start_date", "timeframes"},
+         "tickers": {ticker: {"rows", "last_date", "sha1", "timeframes": [...]}},
+         "failed": {ticker: reason}}
+
+    A ticker is done once every timeframe of the run was written for it.
+    Thread-safe: the fetch and index stages of full_index both update it.
+    """
+
+    def __init__(self, path, run, data=None):
+        self.path = path
+        self.run = run
+        self.data = data or {"run": run, "tickers": {}, "failed": {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, run, resume=False):
+        """
+        Resumes the checkpoint at `path` when asked and it was written for
+        the same run settings; otherwise starts a fresh one.
+        """
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("run") == run:
+                checkpoint = cls(path, run, data)
+                logger.info(
+                    f"Resuming from {path}: {len(checkpoint.done())} tickers done, "
+                    f"{len(data['failed'])} failed"
+                )
+                return checkpoint
+            logger.warning(f"Checkpoint {path} was written for {data.get('run')}, not {run}; starting over")
+        elif resume:
+            logger.warning(f"No checkpoint at {path}; starting over")
+
+        checkpoint = cls(path, run)
+        checkpoint.save()
+        return checkpoint
+
+    def done(self):
+        timeframes = set(self.run["timeframes"])
+        return {t for t, entry in self.data["tickers"].items() if timeframes <= set(entry["timeframes"])}
+
+    def pending(self, tickers):
+        """
+        `tickers` minus the ones already done, in the same order.
+        """
+        with self._lock:
+            done = self.done()
+        return [t for t in tickers if t not in done]
+
+    def fetched(self, batch, prints):
+        """
+        Records the data fingerprint of each fetched ticker (a changed
+        fingerprint drops the timeframes written from older data) and marks
+        the tickers of `batch` that came back without data as failed.
+        """
+        with self._lock:
+            for ticker in batch:
+                fingerprint = prints.get(ticker)
+                if fingerprint is None:
+                    self.data["failed"][ticker] = "no data"
+                    continue
+
+                entry = self.data["tickers"].get(ticker)
+                if entry is None or entry["sha1"] != fingerprint["sha1"]:
+                    self.data["tickers"][ticker] = dict(fingerprint, timeframes=[])
+                self.data["failed"].pop(ticker, None)
+            self._save()
+
+    def completed(self, timeframe, tickers):
+        """
+        Marks `timeframe` as written for `tickers`.
+        """
+        with self._lock:
+            for ticker in tickers:
+                entry = self.data["tickers"].get(ticker)
+                if entry is not None and timeframe not in entry["timeframes"]:
+                    entry["timeframes"].append(timeframe)
+            self._save()
+
+    def failed(self, tickers, reason):
+        with self._lock:
+            for ticker in tickers:
+                self.data["failed"][ticker] = reason
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        self.data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
@@ -1,42 +1,52 @@
 import yfinance as yf
+import numpy as np
 import pandas as pd
 from logging_config import get_logger
 import Constant
+import ohlcv_cache
+from metrics import METRICS
 
 logger = get_logger(__name__)
 
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
 
-def fetch_data(tickers, start_date, end_date, to_weekly=True):
+
+def _fetched(result, *args):
+    return {"rows": 0 if result is None else len(result)}
+
+
+@METRICS.stage("fetch_data", count=_fetched)
+def fetch_data(tickers, start_date, end_date, to_weekly=True, use_cache=None, layout="wide"):
     """
     Fetch OHLCV data for one or more tickers.
     - Single ticker → flat DataFrame
-    - Multiple tickers → flattened columns: "Open/TICKER", "Close/TICKER", ...
+    - Multiple tickers → flattened columns: "TICKER/Open", "TICKER/Close", ...
+    layout="long" returns to_long() of that frame, layout="arrays" to_arrays().
+    With the cache on (Constant.use_cache), daily bars come from the local
+    Parquet cache and only the dates after it are downloaded.
     """
+    if use_cache is None:
+        use_cache = Constant.use_cache
+
     try:
         logger.info(f"Downloading the data for {tickers} from {start_date} to {end_date}")
-        data = yf.download(
-            tickers,
-            start=start_date,
-            end=end_date,
-            interval=Constant.interval,
-            group_by="ticker" if len(tickers) > 1 else "column"
-        )
-
-        if data.empty:
+        if use_cache:
+            data = _fetch_cached(tickers, start_date, end_date)
+        else:
+            data = _download(tickers, start_date, end_date)
+
+        if data is None or data.empty:
             logger.warning(f"No data found for {tickers} in the given date range.")
             return None
 
-        # Handle MultiIndex (typical for multiple tickers, sometimes for single ticker too)
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = [f"{col[0]}/{col[1]}" if col[1] else col[0] for col in data.columns]
-
-        # Reset index → add "Date"
-        data.reset_index(inplace=True)
-
         # If weekly conversion is needed
         if to_weekly:
-            return _convert_to_weekly(data)
+            data = _convert_to_weekly(data)
 
+        if layout == "long":
+            return to_long(data, tickers)
+        if layout == "arrays":
+            return to_arrays(data, tickers)
         return data
 
     except Exception as e:
@@ -44,22 +54,298 @@ def fetch_data(tickers, start_date, end_date, to_weekly=True):
         return None
 
 
+def _fetched_frames(result, tickers, *args):
+    return {"rows": sum(len(frame) for frame in result.values())}
+
+
+@METRICS.stage("fetch_frames", count=_fetched_frames)
+def fetch_frames(tickers, start_date, end_date, use_cache=None):
+    """
+    Daily bars as {ticker: frame with Date + OHLCV} for the `tickers` that
+    have any (see combine_frames for the wide layout). Unlike fetch_data,
+    a failed download raises, so the caller can tell which request failed
+    (see adaptive_fetch.py).
+    """
+    if use_cache is None:
+        use_cache = Constant.use_cache
+    logger.info(f"Downloading the data for {tickers} from {start_date} to {end_date}")
+    if use_cache:
+        return _cached_frames(tickers, start_date, end_date)
+    return _split(_download(tickers, start_date, end_date), tickers)
+
+
+def _download(tickers, start_date, end_date):
+    data = yf.download(
+        tickers,
+        start=start_date,
+        end=end_date,
+        interval=Constant.interval,
+        group_by="ticker" if len(tickers) > 1 else "column"
+    )
+
+    if data is None or data.empty:
+        return None
+
+    # Handle MultiIndex (typical for multiple tickers, sometimes for single ticker too)
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = [f"{col[0]}/{col[1]}" if col[1] else col[0] for col in data.columns]
+
+    # Reset index → add "Date"
+    data.reset_index(inplace=True)
+    return data
+
+
+def _column_name(ticker, field, multi):
+    return f"{ticker}/{field}" if multi else f"{field}/{ticker}"
+
+
+def _block(data, tickers):
+    """
+    (tickers present, dates, float64 array shaped tickers x dates x FIELDS)
+    from a wide frame. Columns are matched by exact name, never by ticker
+    prefix, so "M&M.NS" cannot pick up "M&MFIN.NS".
+    """
+    multi = len(tickers) > 1
+    columns = set(data.columns)
+    present = [t for t in tickers if all(_column_name(t, f, multi) in columns for f in FIELDS)]
+
+    dates = pd.DatetimeIndex(data["Date"])
+    values = data[[_column_name(t, f, multi) for t in present for f in FIELDS]].to_numpy(dtype=np.float64)
+    block = values.reshape(len(dates), len(present), len(FIELDS)).transpose(1, 0, 2)
+    return present, dates, np.ascontiguousarray(block)
+
+
+def to_long(data, tickers):
+    """
+    Wide frame → long frame indexed by (Ticker, Date), one column per OHLCV
+    field. Every ticker keeps every date of the wide frame (NaN where it did
+    not trade), so per-ticker groups match the old column slices.
+    """
+    present, dates, block = _block(data, tickers)
+    index = pd.MultiIndex.from_product([present, dates], names=["Ticker", "Date"])
+    return pd.DataFrame(block.reshape(-1, len(FIELDS)), index=index, columns=FIELDS)
+
+
+def to_arrays(data, tickers):
+    """
+    Wide frame → {ticker: {"Date": dates, "Open": ..., ...}} where every
+    field array is a view into one shared block; nothing is copied per ticker.
+    """
+    present, dates, block = _block(data, tickers)
+    dates = dates.to_numpy()
+    return {
+        ticker: {"Date": dates, **{f: block[j, :, k] for k, f in enumerate(FIELDS)}}
+        for j, ticker in enumerate(present)
+    }
+
+
+def _split(data, tickers):
+    """
+    Wide download → {ticker: [Date, Open, High, Low, Close, Volume]} without
+    the rows where the ticker did not trade.
+    """
+    frames = {}
+    if data is None:
+        return frames
+
+    multi = len(tickers) > 1
+    for ticker in tickers:
+        columns = {_column_name(ticker, f, multi): f for f in FIELDS}
+        if not set(columns).issubset(data.columns):
+            continue
+        frame = data[["Date"] + list(columns)].rename(columns=columns)
+        frame = frame.dropna(subset=FIELDS, how="all").reset_index(drop=True)
+        if not frame.empty:
+            frames[ticker] = frame
+    return frames
+
+
+def combine_frames(frames, tickers, start_date, end_date):
+    """
+    Inverse of _split: the same wide layout yf.download + flattening gives
+    for `tickers`, restricted to [start_date, end_date).
+    """
+    multi = len(tickers) > 1
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+
+    parts = []
+    for ticker in tickers:
+        frame = frames.get(ticker)
+        if frame is None:
+            continue
+        frame = frame[(frame["Date"] >= start) & (frame["Date"] < end)].set_index("Date")[FIELDS]
+        frame.columns = [_column_name(ticker, f, multi) for f in FIELDS]
+        parts.append(frame)
+
+    if not parts:
+        return None
+
+    data = pd.concat(parts, axis=1, sort=True)
+    data.index.name = "Date"
+    return data.reset_index()
+
+
+def _fetch_cached(tickers, start_date, end_date):
+    return combine_frames(_cached_frames(tickers, start_date, end_date), tickers, start_date, end_date)
+
+
+def _cached_frames(tickers, start_date, end_date):
+    """
+    Serve daily bars from the Parquet cache, as {ticker: frame}:
+    - fresh entries (fetched within the TTL) are used as-is
+    - stale entries are topped up from their last complete bar (delta fetch)
+    - missing entries, or ones whose history was re-adjusted, are fetched in full
+    """
+    manifest = ohlcv_cache.load_manifest()
+    frames, full, delta = {}, [], []
+
+    for ticker in tickers:
+        entry = manifest.get(ticker)
+        cached = ohlcv_cache.load(ticker) if ohlcv_cache.covers(entry, start_date) else None
+        if cached is None or cached.empty:
+            full.append(ticker)
+        elif ohlcv_cache.is_fresh(entry):
+            frames[ticker] = cached
+        else:
+            frames[ticker] = cached
+            delta.append(ticker)
+
+    if delta:
+        delta_from = min(ohlcv_cache.delta_start(frames[t]) for t in delta).strftime("%Y-%m-%d")
+        logger.info(f"Delta fetch for {len(delta)} cached tickers from {delta_from}")
+        fresh = _split(_download(delta, delta_from, end_date), delta)
+
+        for ticker in delta:
+            merged = ohlcv_cache.merge(frames[ticker], fresh.get(ticker))
+            if merged is None:
+                logger.info(f"History of {ticker} was re-adjusted, refetching it in full")
+                del frames[ticker]
+                full.append(ticker)
+                continue
+            frames[ticker] = merged
+            ohlcv_cache.save(ticker, merged)
+            ohlcv_cache.mark_fetched(manifest, ticker)
+
+    if full:
+        logger.info(f"Full fetch for {len(full)} uncached tickers from {start_date}")
+        fresh = _split(_download(full, start_date, end_date), full)
+
+        for ticker, frame in fresh.items():
+            frames[ticker] = frame
+            ohlcv_cache.save(ticker, frame)
+            ohlcv_cache.mark_fetched(manifest, ticker, start_date)
+
+    ohlcv_cache.save_manifest(manifest)
+    return frames
+
+
 def _convert_to_weekly(df: pd.DataFrame):
     """
     Convert daily data to weekly candles.
     Uses Monday as week start.
     """
-    df["WeekStart"] = df["Date"] - pd.to_timedelta(df["Date"].dt.weekday, unit="d")
+    return resample(df, "W")
+
+
+# ================= RESAMPLING ================= #
+
+# Aggregation per OHLCV field; any other column keeps its last value
+RESAMPLE_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+
+def period_start(dates, anchor="W"):
+    """
+    First day of the period each date falls in: "W" is Monday-start weeks,
+    anything else a pandas period alias ("M", "Q", "W-WED", ...).
+    """
+    dates = pd.Series(dates)
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+    if anchor == "W":
+        return dates - pd.to_timedelta(dates.dt.weekday, unit="d")
+    return dates.dt.to_period(anchor).dt.start_time
+
+
+def _pick(values, rows):
+    # values[rows[g, c], c], NaN where rows is -1 (no valid row in the group)
+    picked = np.take_along_axis(values, np.clip(rows, 0, None), axis=0)
+    return np.where(rows >= 0, picked, np.nan)
+
+
+def _first(values, starts):
+    index = np.arange(len(values))[:, None]
+    rows = np.minimum.reduceat(np.where(np.isnan(values), len(values), index), starts, axis=0)
+    return _pick(values, np.where(rows == len(values), -1, rows))
 
-    agg_funcs = {
-        col: ("first" if "Open" in col else
-              "max" if "High" in col else
-              "min" if "Low" in col else
-              "last" if "Close" in col else
-              "sum" if "Volume" in col else "last")
-        for col in df.columns if col not in ["Date", "WeekStart"]
-    }
 
-    weekly = df.groupby("WeekStart").agg(agg_funcs).reset_index()
-    weekly.rename(columns={"WeekStart": "Date"}, inplace=True)
-    return weekly
+def _last(values, starts):
+    index = np.arange(len(values))[:, None]
+    return _pick(values, np.maximum.reduceat(np.where(np.isnan(values), -1, index), starts, axis=0))
+
+
+def _max(values, starts):
+    return np.fmax.reduceat(values, starts, axis=0)
+
+
+def _min(values, starts):
+    return np.fmin.reduceat(values, starts, axis=0)
+
+
+def _sum(values, starts):
+    return np.add.reduceat(np.where(np.isnan(values), 0.0, values), starts, axis=0)
+
+
+_REDUCERS = {"first": _first, "max": _max, "min": _min, "last": _last, "sum": _sum}
+
+
+@METRICS.stage("resample")
+def resample(df: pd.DataFrame, anchor="W"):
+    """
+    Daily frame (wide, any number of tickers) → one candle per period,
+    labelled by the period's first day (see period_start).
+
+    Rows are grouped once; each aggregation then runs over the 2-D block
+    of every column sharing it. NaNs are skipped by first/max/min/last and
+    count as 0 in sums, as groupby.agg does.
+    """
+    columns = [c for c in df.columns if c not in ("Date", "WeekStart")]
+    if df["Date"].isna().any():
+        df = df[df["Date"].notna()]
+    if not df["Date"].is_monotonic_increasing:
+        df = df.sort_values("Date", kind="stable")
+    if df.empty:
+        return pd.DataFrame(columns=["Date"] + columns)
+
+    keys = period_start(df["Date"], anchor).to_numpy()
+    starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+
+    by_agg = {}
+    for position, col in enumerate(columns):
+        field = next((p for p in str(col).split("/") if p in RESAMPLE_AGG), None)
+        by_agg.setdefault(RESAMPLE_AGG.get(field, "last"), []).append(position)
+
+    values = df[columns].to_numpy(dtype=np.float64)
+    out = np.empty((len(starts), len(columns)))
+    for agg, positions in by_agg.items():
+        out[:, positions] = _REDUCERS[agg](values[:, positions], starts)
+
+    resampled = pd.DataFrame(out, columns=columns)
+    resampled.insert(0, "Date", keys[starts])
+    return resampled
+
+
+# ================= LOW MEMORY ================= #
+
+PRICE_FIELDS = ["Open", "High", "Low", "Close"]
+
+
+def downcast_prices(df: pd.DataFrame):
+    """
+    The frame with its price columns (wide "TICKER/Close" or per-ticker
+    "Close") as float32, for low-memory runs (Constant.low_memory); the
+    indicators computed from them follow (see indexer.compute_indicators).
+    Volume stays float64: daily volumes summed into a candle pass the
+    integers float32 holds exactly.
+    """
+    columns = [c for c in df.columns if any(p in PRICE_FIELDS for p in str(c).split("/"))]
+    return df.astype(dict.fromkeys(columns, np.float32))
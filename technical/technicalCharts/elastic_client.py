@@ -1,7 +1,54 @@
+import os
+
 from elasticsearch import Elasticsearch
 
-import Constant
+try:
+    import Constant
+except ImportError:  # imported as technical.technicalCharts.elastic_client
+    from technical.technicalCharts import Constant
+
+_clients = {}
+_clients_pid = None
+_ensured = set()
+
+
+def get_es_client(host=None):
+    """
+    Process-wide pooled client per host, created on first use.
+    Connections are kept alive and reused across calls; pool size,
+    timeouts and retries come from Constant.
+    """
+    global _clients_pid
+    host = host or Constant.host
+
+    # Connection pools must not be shared with forked worker processes
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _ensured.clear()
+        _clients_pid = os.getpid()
+
+    if host not in _clients:
+        _clients[host] = Elasticsearch(
+            [host],
+            connections_per_node=Constant.es_connections_per_node,
+            request_timeout=Constant.es_request_timeout,
+            max_retries=Constant.es_max_retries,
+            retry_on_timeout=True,
+            http_compress=Constant.es_http_compress
+        )
+    return _clients[host]
+
 
+def ensure_index(index_name, body, es=None):
+    """
+    Creates the index with `body` if it does not exist. The check runs
+    once per index and process instead of once per ticker.
+    """
+    if index_name in _ensured:
+        return
 
-def get_es_client():
-    return Elasticsearch([Constant.host])
\ No newline at end of file
+    es = es or get_es_client()
+    if not es.indices.exists(index=index_name):
+        # 400 = created meanwhile by another process
+        es.options(ignore_status=400).indices.create(index=index_name, body=body)
+    _ensured.add(index_name)
@@ -0,0 +1,173 @@
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+import time
+
+import Constant
+from logging_config import get_logger
+from metrics import METRICS
+
+logger = get_logger(__name__)
+
+SUFFIX = ".ndjson.gz"
+# Sidecar of every file, listing the indices its actions write to
+INDICES_SUFFIX = ".indices.json"
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _encode_source(source):
+    # Serializer output is already encoded; state documents are dicts
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, str):
+        return source.encode("utf-8")
+    return _dumps(source).encode("utf-8")
+
+
+def bulk_lines(action):
+    """
+    The `_bulk` body lines of one action: the action line, then the
+    source line unless it is a delete.
+    """
+    op = action.get("_op_type", "index")
+    meta = {"_index": action["_index"]}
+    if action.get("_id") is not None:
+        meta["_id"] = action["_id"]
+    yield _dumps({op: meta}).encode("utf-8") + b"\n"
+    if op != "delete":
+        yield _encode_source(action["_source"]) + b"\n"
+
+
+def read_actions(path):
+    """
+    Bulk actions of a file written by FileSink, with the source kept as
+    the encoded bytes on disk (the client sends them as-is).
+    """
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            (op, meta), = json.loads(line).items()
+            action = {"_op_type": op, "_index": meta["_index"]}
+            if "_id" in meta:
+                action["_id"] = meta["_id"]
+            if op != "delete":
+                action["_source"] = next(f).rstrip(b"\n")
+            yield action
+
+
+def list_files(directory):
+    """
+    Files of a FileSink directory, in the order they were written.
+    """
+    return sorted(glob.glob(os.path.join(directory, f"*{SUFFIX}")))
+
+
+def _indices_path(path):
+    return path[:-len(SUFFIX)] + INDICES_SUFFIX
+
+
+def file_indices(path):
+    """
+    Indices the actions of a file write to, sorted: a file of a
+    partitioned timeframe spans several partitions. Read from the file's
+    sidecar; files written before there were sidecars are scanned.
+    """
+    sidecar = _indices_path(path)
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            return json.load(f)
+    return sorted({action["_index"] for action in read_actions(path)})
+
+
+class FileSink:
+    """
+    Offline counterpart of BulkSink: instead of sending the bulk actions,
+    every send() writes them as a gzipped NDJSON `_bulk` body to a new file
+    under `directory` (one file per batch and timeframe in full_index),
+    with a sidecar listing the indices it writes to (see file_indices).
+    replay.py loads the files into Elasticsearch later.
+
+    Files are written under a temporary name and renamed when complete,
+    and numbered after the files already in the directory, so reruns and
+    resumed runs add to it instead of overwriting.
+    """
+
+    # No cluster behind this sink; full_index and index_data skip index setup
+    es = None
+
+    def __init__(self, directory=None, compresslevel=None):
+        self.directory = directory or Constant.bulk_file_dir
+        self.compresslevel = compresslevel or Constant.bulk_file_compresslevel
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.files = []
+        self._lock = threading.Lock()
+        numbers = (re.match(r"\d+", os.path.basename(p)) for p in list_files(self.directory))
+        self._sequence = max((int(m.group()) for m in numbers if m), default=0)
+
+    def _path(self):
+        labels = METRICS.labels()
+        with self._lock:
+            self._sequence += 1
+            name = f"{self._sequence:06d}"
+        if labels.get("batch") is not None:
+            name += f"-batch{labels['batch']}"
+        if labels.get("timeframe") is not None:
+            name += f"-{labels['timeframe']}"
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def send(self, actions):
+        """
+        Writes an iterable of bulk actions to one file; returns the number
+        of documents written. Nothing is left on disk when there were no
+        actions or writing failed.
+        """
+        path = self._path()
+        tmp = f"{path}.tmp"
+        start = time.perf_counter()
+        docs = 0
+        indices = set()
+        try:
+            with gzip.open(tmp, "wb", compresslevel=self.compresslevel) as f:
+                for action in actions:
+                    f.writelines(bulk_lines(action))
+                    indices.add(action["_index"])
+                    docs += 1
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        if not docs:
+            os.remove(tmp)
+            return 0
+        # The sidecar lands first, so every complete file has one
+        with open(_indices_path(path), "w") as f:
+            json.dump(sorted(indices), f)
+        os.replace(tmp, path)
+
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(path)
+        with self._lock:
+            self.files.append({"path": path, "docs": docs, "bytes": size, "seconds": elapsed})
+        METRICS.record("bulk_file", elapsed, docs=docs, bytes=size)
+        logger.info(f"bulk file {path}: {docs} docs, {size / 1024:.0f} KiB gzipped in {elapsed * 1000:.0f} ms")
+        return docs
+
+    def summary(self):
+        with self._lock:
+            files = list(self.files)
+        return {
+            "files": len(files),
+            "docs": sum(f["docs"] for f in files),
+            "bytes": sum(f["bytes"] for f in files)
+        }
+
+    def log_summary(self):
+        s = self.summary()
+        logger.info(
+            f"file sink: {s['docs']} docs in {s['files']} files under {self.directory}, "
+            f"{s['bytes'] / 1024 ** 2:.1f} MiB gzipped"
+        )
@@ -1,11 +1,68 @@
+import argparse
+
+import Constant
+from bulk_sink import BulkSink
+from checkpoint import Checkpoint
+from file_sink import FileSink
 from full_indexing import full_index
 from logging_config import get_logger
+from metrics import METRICS
 
 logger = get_logger(__name__)
 
 def main():
-    logger.info("Starting the full Indexing")
-    full_index()
+    parser = argparse.ArgumentParser(description="Full rebuild of the technical indices")
+    parser.add_argument("--timeframes", nargs="+", choices=list(Constant.timeframes),
+                        default=Constant.full_index_timeframes,
+                        help="candle timeframes to build from the daily download")
+    parser.add_argument("--workers", type=int, default=Constant.workers,
+                        help="processes computing indicators (1 = in-process)")
+    parser.add_argument("--engine", choices=["panel", "ticker"], default=Constant.engine,
+                        help="compute a batch as 2-D panels or one ticker at a time")
+    parser.add_argument("--low-memory", action="store_true", default=Constant.low_memory,
+                        help="compute on float32 prices and indicators (about 7 significant digits)")
+    parser.add_argument("--bulk-threads", type=int, default=Constant.bulk_thread_count,
+                        help="threads sending bulk chunks (1 = streaming_bulk)")
+    parser.add_argument("--bulk-chunk-docs", type=int, default=Constant.bulk_chunk_size,
+                        help="max documents per bulk chunk")
+    parser.add_argument("--bulk-chunk-mb", type=float, default=Constant.bulk_max_chunk_bytes / 1024 ** 2,
+                        help="max size of a bulk chunk in MiB")
+    parser.add_argument("--no-bulk-load", dest="bulk_load", action="store_false", default=Constant.bulk_load,
+                        help="keep the live index settings (refresh, translog, replicas) during the load")
+    parser.add_argument("--forcemerge", action="store_true", default=Constant.bulk_load_forcemerge,
+                        help="force-merge the index after a successful bulk load")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip tickers a previous run finished and retry the failed ones")
+    parser.add_argument("--output-dir",
+                        help="write gzipped NDJSON bulk files here instead of indexing (load them with replay.py)")
+    parser.add_argument("--metrics-json", help="write per-stage metrics (per batch and per run) to this JSON file")
+    parser.add_argument("--metrics-prom", help="write per-stage run totals to this file in Prometheus text format")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        sink = FileSink(args.output_dir)
+    else:
+        sink = BulkSink(
+            chunk_size=args.bulk_chunk_docs,
+            max_chunk_bytes=int(args.bulk_chunk_mb * 1024 ** 2),
+            thread_count=args.bulk_threads
+        )
+
+    run = {"start_date": Constant.startDate, "timeframes": sorted(args.timeframes)}
+    checkpoint = Checkpoint.open(Constant.checkpoint_path, run, resume=args.resume)
+
+    logger.info(f"Starting the full Indexing of {', '.join(args.timeframes)} "
+                f"with {args.workers} workers ({args.engine} engine)")
+    try:
+        full_index(workers=args.workers, engine=args.engine, sink=sink,
+                   bulk_load_mode=args.bulk_load, forcemerge=args.forcemerge, timeframes=args.timeframes,
+                   checkpoint=checkpoint, low_memory=args.low_memory)
+    finally:
+        if args.metrics_json:
+            METRICS.to_json(args.metrics_json)
+        if args.metrics_prom:
+            with open(args.metrics_prom, "w") as f:
+                f.write(METRICS.to_prometheus())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,47 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from datetime import datetime, timedelta
+from multiprocessing import get_context
+import queue
+import threading
 import Constant
-from data_fetcher import fetch_data
-from indexer import index_data
+import numpy as np
 import pandas as pd
+from adaptive_fetch import AdaptiveFetcher
+from benchmarks import fetch_benchmarks, prepare_benchmarks
+from bulk_load import bulk_load
+from bulk_sink import BulkSink
+from checkpoint import fingerprints
+from data_fetcher import downcast_prices, resample, to_long
+from index_state import save_states, save_versions
+from indexer import prepare_ticker
+from indicators import fingerprints as indicator_fingerprints
+from logging_config import get_logger
+from metrics import METRICS, collect, reset_rss_peak, rss_peak_bytes
+from partitions import ensure_candle_index, reseal_partitions, unseal_partitions
+from panel import prepare_panel, select_tickers
+from pipeline import DONE, END, PipelineStopped, Stage, get, put, raise_errors
+from serializer import doc_actions
+from timeframes import WEEKLY, get_timeframe
 from technical.fetchConstituents.fetchTickerToIndexMapping import build_reverse_dict, get_tickers_with_custom_flag
 
+logger = get_logger(__name__)
 
-def get_nifty_df():
+
+def get_universe():
     """
-    Fetches and returns Nifty 50 data with columns [Date, Close].
+    Returns (tickers, tickerDictionary, indexDictionary): every stock that is
+    a constituent of some index plus the indices themselves.
     """
-    nifty_symbol = "^NSEI"
-    end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-    nifty_data = fetch_data([nifty_symbol], Constant.startDate, end_date)
-    print(f"nifty data fetched from {Constant.startDate} to {end_date}")
-
-    if nifty_data is None or nifty_data.empty:
-        print("Nifty data not fetched.")
-        return None
-
-    if isinstance(nifty_data.columns, pd.MultiIndex):
-        try:
-            nifty_df = nifty_data.xs(nifty_symbol, axis=1, level=1).copy()
-        except KeyError:
-            print("Nifty symbol not found in fetched data.")
-            return None
-    else:
-        nifty_cols = [col for col in nifty_data.columns if col.endswith(f"/{nifty_symbol}")]
-        if not nifty_cols:
-            print("Nifty columns not found.")
-            return None
-        nifty_df = nifty_data[nifty_cols].copy()
-        nifty_df.columns = [col.split("/")[0] for col in nifty_cols]
-
-    nifty_df = nifty_df.reset_index(drop=True)
-    nifty_df["Date"] = nifty_data["Date"].values
-    nifty_df["Date"] = pd.to_datetime(nifty_df["Date"])
-    nifty_df = nifty_df[["Date", "Close"]].copy()
-    return nifty_df
-
-
-def full_index():
-    batch_size = Constant.batch_size
     tickerDictionary = build_reverse_dict()
     indexDictionary = get_tickers_with_custom_flag()
 
@@ -49,61 +40,272 @@ def full_index():
         set(tickerDictionary.keys()) |
         {idx for indices in tickerDictionary.values() for idx in indices}
     )
+    return tickers, tickerDictionary, indexDictionary
+
+
+def iter_ticker_frames(long_df):
+    """
+    Yields (ticker, frame with OHLCV + Date) for each ticker of a long batch
+    frame (data_fetcher.to_long). Rows are taken by the groupby positions of
+    each ticker out of one array, instead of scanning column names.
+    """
+    values = long_df.to_numpy(dtype=np.float64)
+    dates = long_df.index.get_level_values("Date")
+
+    for ticker, rows in long_df.groupby(level="Ticker", sort=False).indices.items():
+        ticker_data = pd.DataFrame(values[rows], columns=long_df.columns)
+        ticker_data["Date"] = dates[rows]
+        ticker_data["Ticker"] = ticker
+        yield ticker, ticker_data
+
+
+def ticker_metadata(ticker, tickerDictionary, indexDictionary):
+    """
+    {"indices", "type", "isCustom"} for one ticker.
+    """
+    indices = tickerDictionary.get(ticker, [])
+
+    type_ = "stock"
+    isCustom = False
+    if ticker in indexDictionary:
+        type_ = "index"
+        isCustom = indexDictionary[ticker]
+
+    return {"indices": indices, "type": type_, "isCustom": isCustom}
+
+
+def prepare_batch(data_df, batch, benchmarks, tickerDictionary, indexDictionary,
+                  engine="panel", pool=None, workers=1, timeframe=WEEKLY, low_memory=False):
+    """
+    Yields (ticker, docs, state) for every ticker of a fetched batch of
+    `timeframe` candles.
+
+    engine="panel" computes the batch as 2-D panels (split into one
+    sub-panel per worker when a pool is given, of at least
+    Constant.panel_min_chunk_tickers tickers); engine="ticker" runs
+    prepare_ticker on each ticker frame. With a pool, results come back
+    in completion order. Worker metrics are merged into METRICS under the
+    caller's labels. Ticker metadata is handed to the serializer once per
+    ticker; low_memory computes on float32 prices (see Constant.low_memory).
+    """
+    metadata = {t: ticker_metadata(t, tickerDictionary, indexDictionary) for t in batch}
+    if engine == "panel":
+        if low_memory:
+            data_df = downcast_prices(data_df)
+        if pool is None:
+            yield from prepare_panel(data_df, batch, benchmarks, metadata, timeframe)
+            return
+
+        # Chunks of a few tickers would undo the panel's vectorization
+        count = max(1, min(workers, len(batch) // Constant.panel_min_chunk_tickers))
+        chunks = [batch[k::count] for k in range(count)]
+        futures = [
+            pool.submit(collect, prepare_panel, select_tickers(data_df, chunk), chunk, benchmarks, metadata, timeframe)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            results, snapshot = future.result()
+            METRICS.merge(snapshot)
+            yield from results
+        return
 
-    nifty_df = get_nifty_df()
-    if nifty_df is None or nifty_df.empty:
-        print("Nifty data unavailable. Skipping indexing.")
+    frames = iter_ticker_frames(to_long(data_df, batch))
+    if low_memory:
+        frames = ((ticker, downcast_prices(ticker_data)) for ticker, ticker_data in frames)
+    if pool is None:
+        for ticker, ticker_data in frames:
+            yield prepare_ticker(ticker_data, ticker, benchmarks, timeframe, metadata[ticker])
+        return
+
+    futures = [
+        pool.submit(collect, prepare_ticker, ticker_data, ticker, benchmarks, timeframe, metadata[ticker])
+        for ticker, ticker_data in frames
+    ]
+    for future in as_completed(futures):
+        result, snapshot = future.result()
+        METRICS.merge(snapshot)
+        yield result
+
+
+def _fetch_stage(tickers, end_date, fetched, stop, checkpoint=None):
+    """
+    Downloads the daily bars batch after batch into `fetched`, blocking
+    while the compute stage is a full queue behind. Batch sizes, bisection
+    of failed requests and retries are up to adaptive_fetch.AdaptiveFetcher;
+    a batch holds the tickers that came back with data.
+    """
+    fetcher = AdaptiveFetcher(Constant.startDate, end_date, wait=stop.wait)
+    batches = fetcher.batches(tickers)
+    number = 0
+    while True:
+        number += 1
+        with METRICS.context(batch=number):
+            batch, daily_df = next(batches, (None, None))
+        if batch is None:
+            break
+        if checkpoint is not None:
+            checkpoint.fetched(batch, fingerprints(daily_df, batch))
+        put(fetched, (number, batch, daily_df), stop)
+
+    if checkpoint is not None:
+        for ticker, reason in fetcher.failed.items():
+            checkpoint.failed([ticker], reason)
+    put(fetched, DONE, stop)
+
+
+def _index_stage(ready, sink, es, stop, checkpoint=None):
+    """
+    Drains computed tickers from `ready`: each job is a (timeframe, batch
+    number, batch) header, its (ticker, docs, state) results, then END. A
+    job is sent as one bulk stream; once it is written its states are saved,
+    its tickers checkpointed and its metrics logged. Without `es` (offline
+    sink) the states go into the sink as well.
+    """
+    while True:
+        job = get(ready, stop)
+        if job is DONE:
+            return
+        tf, number, batch = job
+        tickers, states = [], []
+
+        def actions():
+            while True:
+                item = get(ready, stop)
+                if item is END:
+                    return
+                ticker, docs, state = item
+                tickers.append(ticker)
+                states.append(state)
+                yield from doc_actions(tf.index_name, docs, tf.partition_years)
+
+        try:
+            with METRICS.context(batch=number, timeframe=tf.name):
+                success = sink.send(actions())
+                logger.info(f"Indexed {success} {tf.name} documents for batch {number}")
+                save_states(es, tf.state_index_name, states, sink if es is None else None)
+        except PipelineStopped:
+            raise
+        except Exception as e:
+            if checkpoint is not None:
+                checkpoint.failed(batch, f"{tf.name}: {e}")
+            raise
+
+        if checkpoint is not None:
+            checkpoint.completed(tf.name, tickers)
+        METRICS.log_summary(number, tf.name)
+
+
+def full_index(tickers=None, workers=None, engine=None, sink=None, bulk_load_mode=False, forcemerge=None,
+               timeframes=None, checkpoint=None, low_memory=None):
+    """
+    Computes and indexes every candle of `tickers` (default: the whole
+    universe) on each of `timeframes` (default:
+    Constant.full_index_timeframes). Daily bars are downloaded once per
+    batch (adaptive_fetch.py sizes the batches and retries failing
+    symbols) and resampled to every timeframe, each into its own index.
+    With bulk_load_mode those indices run on bulk-load settings for the
+    duration of the load (see bulk_load.bulk_load).
+    With a checkpoint.Checkpoint, tickers it has done are skipped and
+    progress is recorded after every written job.
+    With an offline `sink` (file_sink.FileSink) nothing touches
+    Elasticsearch; replay.py loads its files later.
+    A run over the whole universe records the indicator versions it wrote
+    (see recompute.py).
+    low_memory (default: Constant.low_memory) computes on float32 prices.
+    The peak RSS of every batch is logged and kept in METRICS (with the
+    fetch and index threads, which share the process, and the workers'
+    own peaks) to size batch_size by.
+    """
+    workers = workers or Constant.workers
+    engine = engine or Constant.engine
+    low_memory = Constant.low_memory if low_memory is None else low_memory
+    timeframes = [get_timeframe(name) for name in (timeframes or Constant.full_index_timeframes)]
+    universe, tickerDictionary, indexDictionary = get_universe()
+    whole_universe = tickers is None
+    if whole_universe:
+        tickers = universe
+    if checkpoint is not None:
+        pending = checkpoint.pending(tickers)
+        logger.info(f"Checkpoint: {len(tickers) - len(pending)} tickers done, {len(pending)} to index")
+        tickers = pending
+        if not tickers:
+            return
+
+    benchmark_daily = fetch_benchmarks()
+    benchmarks = {tf.name: prepare_benchmarks(benchmark_daily, tf) for tf in timeframes}
+    if not all(benchmarks.values()):
+        logger.warning("Benchmark data unavailable. Skipping indexing.")
         return
 
     end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-    print(f"data fetched from {Constant.startDate} to {end_date}")
+    logger.info(f"data fetched from {Constant.startDate} to {end_date}")
+    sink = sink or BulkSink()
+    es = sink.es
+    # Forked workers would inherit locks held by the fetch and index threads
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("forkserver")) if workers > 1 else None
+    sealed = []
+    try:
+        if es is not None:
+            for tf in timeframes:
+                ensure_candle_index(tf.index_name, es, tf.partition_years)
+                if tf.partition_years:
+                    # A rebuild rewrites history, sealed partitions included;
+                    # they are sealed and force-merged again at the end
+                    sealed += unseal_partitions(tf.index_name, es)
 
-    for i in range(0, len(tickers), batch_size):
-        batch = tickers[i:i + batch_size]
-        data_df = fetch_data(batch, Constant.startDate, end_date)
+        with ExitStack() as load_settings:
+            if bulk_load_mode and es is not None:
+                for tf in timeframes:
+                    load_settings.enter_context(bulk_load(tf.index_name, es, forcemerge))
 
-        if data_df is None or data_df.empty:
-            continue
+            # fetch (thread) -> compute (here, with the pool) -> index (thread);
+            # the bounded queues hold the stages at most a few items apart
+            stop = threading.Event()
+            fetched = queue.Queue(maxsize=Constant.pipeline_prefetch_batches)
+            ready = queue.Queue(maxsize=Constant.pipeline_ready_tickers)
+            fetcher = Stage("fetch", _fetch_stage, (tickers, end_date, fetched, stop, checkpoint), stop)
+            indexer = Stage("index", _index_stage, (ready, sink, es, stop, checkpoint), stop)
+            fetcher.start()
+            indexer.start()
 
-        if isinstance(data_df.columns, pd.MultiIndex):
             try:
-                date_series = data_df[("Date", "")].copy()
-            except KeyError:
-                print("Date column not found in MultiIndex DataFrame")
-                continue
-        else:
-            date_series = data_df["Date"].copy() if "Date" in data_df.columns else None
-
-        if date_series is None:
-            print("Date column is missing, skipping batch")
-            continue
-
-        for ticker in batch:
-            if isinstance(data_df.columns, pd.MultiIndex):
-                try:
-                    ticker_data = data_df.xs(ticker, axis=1, level=1).copy()
-                except KeyError:
-                    continue
-            else:
-                ticker_cols = [col for col in data_df.columns if col.startswith(ticker)]
-                if not ticker_cols:
-                    continue
-                ticker_data = data_df[ticker_cols].copy()
-                ticker_data.columns = [col.split("/")[1] for col in ticker_cols]
-
-            ticker_data = ticker_data.reset_index(drop=True)
-            ticker_data["Date"] = date_series.values
-            ticker_data["Ticker"] = ticker
-            indices = tickerDictionary.get(ticker, [])
-
-            type_ = "stock"
-            isCustom = False
-            if ticker in indexDictionary:
-                type_ = "index"
-                isCustom = indexDictionary[ticker]
-
-            ticker_data["type"] = [type_] * len(ticker_data)
-            ticker_data["isCustom"] = [isCustom] * len(ticker_data)
-            ticker_data["indices"] = [indices] * len(ticker_data)
-
-            index_data(Constant.index_name, ticker_data, ticker, nifty_df)
+                while True:
+                    item = get(fetched, stop)
+                    if item is DONE:
+                        break
+                    number, batch, daily_df = item
+                    reset_rss_peak()
+
+                    for tf in timeframes:
+                        with METRICS.context(batch=number, timeframe=tf.name):
+                            data_df = resample(daily_df, tf.anchor)
+                            put(ready, (tf, number, batch), stop)
+                            for result in prepare_batch(data_df, batch, benchmarks[tf.name], tickerDictionary,
+                                                        indexDictionary, engine, pool, workers, tf, low_memory):
+                                put(ready, result, stop)
+                            put(ready, END, stop)
+
+                    rss = rss_peak_bytes()
+                    METRICS.peak("rss_bytes", rss, {"batch": number})
+                    logger.info(f"Batch {number}: peak RSS {rss / 1024 ** 2:.0f} MiB ({len(batch)} tickers)")
+                put(ready, DONE, stop)
+            except PipelineStopped:
+                pass
+            except BaseException:
+                stop.set()
+                raise
+            finally:
+                fetcher.join()
+                indexer.join()
+            raise_errors(fetcher, indexer)
+
+        if whole_universe:
+            for tf in timeframes:
+                save_versions(es, tf.state_index_name, indicator_fingerprints(tf), sink if es is None else None)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if sealed:
+            reseal_partitions(sealed, es)
+        sink.log_summary()
+        METRICS.log_summary()
@@ -1,8 +1,11 @@
-# from incremental_indexing import incremental_index
-#
-#
-# def main():
-#     incremental_index()
-#
-# if __name__ == "__main__":
-#     main()
\ No newline at end of file
+from incremental_indexing import incremental_index
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+def main():
+    logger.info("Starting the incremental Indexing")
+    incremental_index()
+
+if __name__ == "__main__":
+    main()
@@ -1,113 +1,122 @@
-# from datetime import datetime, timedelta
-# import pandas as pd
-# import Constant
-# from Constant import roc_period
-# from data_fetcher import fetch_data
-# from indexer import index_data
-# from logging_config import get_logger
-#
-# logger = get_logger(__name__)
-#
-#
-# # ✅ Added this function (same as in full_indexing) to fetch Nifty data
-# def get_nifty_df():
-#     """
-#     Fetches and returns Nifty 50 data with columns [Date, Close].
-#     """
-#     nifty_symbol = "^NSEI"  # Adjust if your data source uses a different symbol
-#
-#     nifty_data = fetch_data([nifty_symbol], Constant.startDate, datetime.now().strftime("%Y-%m-%d"))
-#     if nifty_data is None or nifty_data.empty:
-#         logger.error("Nifty data not fetched.")
-#         return None
-#
-#     if isinstance(nifty_data.columns, pd.MultiIndex):
-#         try:
-#             nifty_df = nifty_data.xs(nifty_symbol, axis=1, level=1).copy()
-#         except KeyError:
-#             logger.error("Nifty symbol not found in fetched data.")
-#             return None
-#     else:
-#         nifty_cols = [col for col in nifty_data.columns if col.endswith(f"/{nifty_symbol}")]
-#         if not nifty_cols:
-#             logger.error("Nifty columns not found.")
-#             return None
-#         nifty_df = nifty_data[nifty_cols].copy()
-#         nifty_df.columns = [col.split("/")[0] for col in nifty_cols]
-#
-#     nifty_df = nifty_df.reset_index(drop=True)
-#     if isinstance(nifty_data.columns, pd.MultiIndex):
-#         nifty_df["Date"] = nifty_data[("Date", "")].values
-#     else:
-#         nifty_df["Date"] = nifty_data["Date"].values
-#
-#     nifty_df["Date"] = pd.to_datetime(nifty_df["Date"])
-#     nifty_df = nifty_df[["Date", "Close"]].copy()
-#     return nifty_df
-#
-#
-# def incremental_index(batch_size=50):
-#     today = datetime.now()
-#     date_from_index = (today - timedelta(days=(2*roc_period+3))).strftime("%Y-%m-%d")
-#     date_to_index = (today + timedelta(days=1)).strftime("%Y-%m-%d")
-#
-#     logger.info(f"Starting incremental indexing from {date_from_index} to {date_to_index}")
-#
-#     nifty_df = get_nifty_df()  # ✅ Added: Fetch Nifty data once
-#
-#     if nifty_df is None or nifty_df.empty:
-#         logger.warning("Nifty data unavailable. Skipping indexing.")
-#         return
-#
-#     nifty500 = Constant.nifty500 + Constant.indices
-#     for i in range(0, len(nifty500), batch_size):
-#         batch = nifty500[i:i + batch_size]
-#         logger.info(f"Processing batch {i // batch_size + 1} with {len(batch)} tickers")
-#
-#         data_df = fetch_data(batch, date_from_index, date_to_index)
-#
-#         if data_df is None or data_df.empty:
-#             logger.warning("No data returned for batch, skipping...")
-#             continue
-#
-#         # Extract Date column from MultiIndex or flat structure
-#         if isinstance(data_df.columns, pd.MultiIndex):
-#             try:
-#                 date_series = data_df[("Date", "")].copy()
-#             except KeyError:
-#                 logger.error("Date column missing in MultiIndex DataFrame, skipping batch")
-#                 continue
-#         else:
-#             date_series = data_df["Date"].copy() if "Date" in data_df.columns else None
-#
-#         if date_series is None:
-#             logger.error("Date column missing, skipping batch")
-#             continue
-#
-#         for ticker in batch:
-#             logger.info(f"Indexing data for {ticker}")
-#
-#             # Extract ticker-specific data
-#             if isinstance(data_df.columns, pd.MultiIndex):
-#                 try:
-#                     ticker_data = data_df.xs(ticker, axis=1, level=1).copy()
-#                 except KeyError:
-#                     logger.warning(f"No data found for {ticker}, skipping...")
-#                     continue
-#             else:
-#                 ticker_cols = [col for col in data_df.columns if col.endswith(f"/{ticker}")]
-#                 if not ticker_cols:
-#                     logger.warning(f"No relevant columns found for {ticker}, skipping...")
-#                     continue
-#                 ticker_data = data_df[ticker_cols].copy()
-#                 ticker_data.columns = [col.split("/")[0] for col in ticker_cols]
-#
-#             # Add Date & Ticker columns
-#             ticker_data = ticker_data.reset_index(drop=True)
-#             ticker_data["Date"] = date_series.values
-#             ticker_data["Ticker"] = ticker
-#
-#             # ✅ Updated: Pass nifty_df so index_data can calculate and merge Nifty ROC
-#             index_data_incremental("nifty_data_weekly", ticker_data, ticker, nifty_df)
-#
-#     logger.info("Incremental indexing completed successfully.")
+from datetime import datetime, timedelta
+import pandas as pd
+import Constant
+from benchmarks import fetch_benchmarks, prepare_benchmarks
+from bulk_sink import BulkSink
+from data_fetcher import fetch_data, resample, to_long
+from elastic_client import get_es_client
+from full_indexing import get_universe, iter_ticker_frames, full_index, ticker_metadata
+from index_state import load_states, load_versions, save_states
+from indexer import index_data_incremental, index_data_streaming
+from indicators import changed_indicators, fetch_lookback, fingerprints
+from logging_config import get_logger
+from streaming import IndicatorStream
+from timeframes import WEEKLY, get_timeframe
+
+logger = get_logger(__name__)
+
+# Candles without a single trading day are not produced, so fetch a bit more
+HOLIDAY_CUSHION_WEEKS = 4
+
+
+def window_start(state, timeframe=WEEKLY):
+    """
+    Day on which the fetch window for a ticker with `state` on `timeframe`
+    starts: the longest lookback an indicator declares (52w high/low, see
+    indicators.INDICATORS) in candles before the seed, from the first day
+    of a candle (a Monday on weekly candles).
+    """
+    seed = pd.Timestamp(state["seed_date"])
+    if timeframe.anchor == "D":
+        # Daily candles are trading days
+        return seed - pd.offsets.BDay(fetch_lookback(timeframe)) - timedelta(weeks=HOLIDAY_CUSHION_WEEKS)
+    first = (pd.Period(seed, timeframe.anchor) - fetch_lookback(timeframe)).start_time
+    return pd.Period(first - timedelta(weeks=HOLIDAY_CUSHION_WEEKS), timeframe.anchor).start_time
+
+
+def fetch_start(state, timeframe=WEEKLY):
+    """
+    First day to fetch for a ticker with `state` on `timeframe`: its seed
+    candle when the state carries a usable indicator stream (only later
+    candles are needed), the lookback window otherwise.
+    """
+    if IndicatorStream.from_state(state.get("stream"), timeframe) is not None:
+        return pd.Timestamp(state["seed_date"])
+    return window_start(state, timeframe)
+
+
+def incremental_index():
+    """
+    Re-indexes only the candles after each ticker's persisted RSI seed, on
+    every timeframe of Constant.full_index_timeframes from one daily
+    download per batch. Tickers whose state carries an indicator stream
+    are updated candle by candle from it; older states fetch the lookback
+    window the indicators need. Tickers without state on some timeframe
+    (new listings, new index constituents, a newly added timeframe) get a
+    full index of those timeframes first.
+    """
+    batch_size = Constant.batch_size
+    timeframes = [get_timeframe(name) for name in Constant.full_index_timeframes]
+    tickers, tickerDictionary, indexDictionary = get_universe()
+    es = get_es_client()
+    states = {tf.name: load_states(es, tf.state_index_name, tickers) for tf in timeframes}
+
+    for tf in timeframes:
+        stale = changed_indicators(load_versions(es, tf.state_index_name), fingerprints(tf))
+        if stale:
+            logger.warning(
+                f"{tf.index_name} holds other versions of {', '.join(stale)}; new candles get the current ones, "
+                f"run recompute.py to update the rest"
+            )
+
+    missing = [tf.name for tf in timeframes if any(t not in states[tf.name] for t in tickers)]
+    new_tickers = {t for t in tickers if any(t not in states[name] for name in missing)}
+    if new_tickers:
+        logger.info(
+            f"{len(new_tickers)} tickers have no indexing state on {', '.join(missing)}, running full index for them"
+        )
+        full_index([t for t in tickers if t in new_tickers], timeframes=missing)
+
+    tickers = [t for t in tickers if t not in new_tickers]
+    if not tickers:
+        logger.info("No tickers with indexing state, nothing to do incrementally")
+        return
+
+    end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    benchmark_start = min(window_start(states[tf.name][t], tf) for tf in timeframes for t in tickers)
+
+    benchmark_daily = fetch_benchmarks(benchmark_start.strftime("%Y-%m-%d"))
+    benchmarks = {tf.name: prepare_benchmarks(benchmark_daily, tf) for tf in timeframes}
+    if not all(benchmarks.values()):
+        logger.warning("Benchmark data unavailable. Skipping indexing.")
+        return
+
+    sink = BulkSink(es)
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i:i + batch_size]
+        start_date = min(fetch_start(states[tf.name][t], tf) for tf in timeframes for t in batch).strftime("%Y-%m-%d")
+        logger.info(f"Processing batch {i // batch_size + 1} with {len(batch)} tickers from {start_date}")
+
+        daily_df = fetch_data(batch, start_date, end_date, to_weekly=False)
+        if daily_df is None or daily_df.empty:
+            logger.warning("No data returned for batch, skipping...")
+            continue
+
+        for tf in timeframes:
+            tf_states = states[tf.name]
+            new_states = []
+            for ticker, ticker_data in iter_ticker_frames(to_long(resample(daily_df, tf.anchor), batch)):
+                metadata = ticker_metadata(ticker, tickerDictionary, indexDictionary)
+                state = index_data_streaming(
+                    tf.index_name, ticker_data, ticker, benchmarks[tf.name], tf_states[ticker], sink, tf, metadata
+                )
+                if state is None:
+                    state = index_data_incremental(
+                        tf.index_name, ticker_data, ticker, benchmarks[tf.name], tf_states[ticker], sink, tf, metadata
+                    )
+                new_states.append(state)
+
+            save_states(es, tf.state_index_name, new_states)
+
+    sink.log_summary()
+    logger.info("Incremental indexing completed successfully.")
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from elasticsearch import helpers
+
+from elastic_client import ensure_index
+from logging_config import get_logger
+from mappings import state_mapping
+from streaming import IndicatorStream
+from timeframes import WEEKLY
+
+logger = get_logger(__name__)
+
+# Document of a state index holding the indicator fingerprints (see
+# indicators.fingerprints) its candle index was built with; never a ticker
+VERSIONS_ID = "indicator_versions"
+
+
+def build_state(ticker, data, previous=None, prices=None, timeframe=WEEKLY):
+    """
+    Per-ticker state after indexing `data` (output of compute_indicators).
+    With `prices`, the High/Low/Close of `data` before their defaults were
+    filled (row-aligned), the state also carries the indicator stream.
+    See state_from_arrays.
+    """
+    avg_gain = data["rsi_avg_gain"].to_numpy(dtype=np.float64)
+    avg_loss = data["rsi_avg_loss"].to_numpy(dtype=np.float64)
+    stream = None
+    if prices is not None:
+        stream = history_stream(
+            timeframe, *(prices[f].to_numpy(dtype=np.float64) for f in ("High", "Low", "Close")), avg_gain, avg_loss
+        )
+    return state_from_arrays(
+        ticker, data["Date"].to_numpy(), data["Close"].to_numpy(dtype=np.float64), avg_gain, avg_loss,
+        previous, stream
+    )
+
+
+def history_stream(timeframe, high, low, close, avg_gain, avg_loss):
+    """
+    `stream` argument of state_from_arrays for computed history: the
+    streaming.IndicatorStream state as of a row, rebuilt from the arrays.
+    Prices must still hold their NaNs.
+    """
+    def stream(row):
+        return IndicatorStream.from_history(timeframe, high, low, close, avg_gain, avg_loss, row).to_state()
+    return stream
+
+
+def state_from_arrays(ticker, dates, close, avg_gain, avg_loss, previous=None, stream=None):
+    """
+    The last candle may still be an open week, so the RSI seed is taken
+    from the candle before it; the next run recomputes from there on.
+    `stream(row)`, when given, returns the indicator stream state as of the
+    seed row, stored as "stream" so the next run can continue candle by
+    candle (see indexer.index_data_streaming).
+    Returns `previous` (with last_date refreshed) when there are too few
+    computed candles, or None when there is nothing to persist.
+    """
+    rows = np.flatnonzero(~np.isnan(avg_gain) & ~np.isnan(avg_loss))
+
+    def day(i):
+        return pd.Timestamp(dates[i]).strftime("%Y-%m-%d")
+
+    if len(rows) < 2:
+        if previous is None:
+            return None
+        state = dict(previous)
+        if len(rows) == 1:
+            state["last_date"] = day(rows[-1])
+        return state
+
+    seed, last = rows[-2], rows[-1]
+    state = {
+        "ticker": ticker,
+        "last_date": day(last),
+        "seed_date": day(seed),
+        "seed_close": float(close[seed]),
+        "rsi_avg_gain": float(avg_gain[seed]),
+        "rsi_avg_loss": float(avg_loss[seed])
+    }
+    if stream is not None:
+        state["stream"] = stream(seed)
+    return state
+
+
+def load_states(es, index_name, tickers):
+    """
+    Returns {ticker: state} for every ticker that has persisted state.
+    """
+    if not tickers or not es.indices.exists(index=index_name):
+        return {}
+
+    resp = es.mget(index=index_name, ids=list(tickers))
+    return {
+        doc["_id"]: doc["_source"]
+        for doc in resp["docs"]
+        if doc.get("found")
+    }
+
+
+def state_actions(index_name, states):
+    """
+    Bulk actions writing each (non-None) state under its ticker.
+    """
+    for s in states:
+        if s is not None:
+            yield {"_op_type": "index", "_index": index_name, "_id": s["ticker"], "_source": s}
+
+
+def save_states(es, index_name, states, sink=None):
+    """
+    Writes the states to `index_name`, or into `sink` when given (e.g. an
+    offline file_sink.FileSink, where `es` may be None).
+    """
+    states = [s for s in states if s is not None]
+    if not states:
+        return
+
+    if sink is not None:
+        sink.send(state_actions(index_name, states))
+    else:
+        ensure_index(index_name, state_mapping, es)
+        helpers.bulk(es, state_actions(index_name, states), raise_on_error=True)
+    logger.info(f"Saved indexing state for {len(states)} tickers")
+
+
+def load_versions(es, index_name):
+    """
+    Indicator fingerprints recorded in the state index `index_name`, or
+    None when none were recorded (indices built before the registry).
+    """
+    if not es.indices.exists(index=index_name):
+        return None
+    doc = es.options(ignore_status=404).get(index=index_name, id=VERSIONS_ID)
+    return doc["_source"]["indicators"] if doc.get("found") else None
+
+
+def save_versions(es, index_name, fingerprints, sink=None):
+    """
+    Records the indicator fingerprints the candle index of the state index
+    `index_name` now holds; into `sink` when given, as save_states.
+    """
+    action = {"_op_type": "index", "_index": index_name, "_id": VERSIONS_ID, "_source": {"indicators": fingerprints}}
+    if sink is not None:
+        sink.send([action])
+    else:
+        ensure_index(index_name, state_mapping, es)
+        helpers.bulk(es, [action], raise_on_error=True)
+    logger.info(f"Recorded indicator versions in {index_name}")
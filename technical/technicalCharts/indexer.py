@@ -1,10 +1,16 @@
 import pandas as pd
-from elasticsearch import helpers
 
-from Constant import rsi_window, roc_period, atr_period
+from benchmarks import benchmark_columns
+from bulk_sink import BulkSink
 from elastic_client import get_es_client
+from index_state import build_state, state_from_arrays
+from indicators import INDICATORS, MA_PERIODS, defaults
 from logging_config import get_logger
-from mappings import index_mapping
+from metrics import METRICS
+from partitions import ensure_candle_index
+from serializer import build_actions, doc_actions, serialize_columns, serialize_documents
+from streaming import IndicatorStream, stream_arrays
+from timeframes import WEEKLY
 import numpy as np
 
 logger = get_logger(__name__)
@@ -12,74 +18,104 @@ logger = get_logger(__name__)
 
 # ================= INDICATORS ================= #
 
-def calculate_rsi(data, period):
-    data = data.copy()
+def wilder_smooth(values, period, seed):
+    """
+    Wilder smoothing over a float array, starting from `seed` at position 0.
+    avg[i] = (avg[i-1] * (period - 1) + values[i]) / period
+    """
+    out = np.empty(len(values), dtype=np.float64)
+    if len(values) == 0:
+        return out
 
-    # Drop rows where Close is NaN (only for calculation)
-    valid_data = data[data["Close"].notna()].copy()
+    # Plain Python floats are far cheaper to iterate than NumPy scalars
+    avg = float(seed)
+    out[0] = avg
+    for i, v in enumerate(values[1:].tolist(), start=1):
+        avg = (avg * (period - 1) + v) / period
+        out[i] = avg
+    return out
 
-    # If not enough data, return original with NaN RSI
-    if len(valid_data) <= period:
-        data["rsi"] = np.nan
-        return data
 
-    valid_data["change"] = valid_data["Close"].diff()
-    valid_data["gain"] = valid_data["change"].clip(lower=0)
-    valid_data["loss"] = -valid_data["change"].clip(upper=0)
+def rsi_kernel(close, period, seed=None):
+    """
+    Wilder RSI over a 1-D array of closes without NaNs.
+    Returns (rsi, avg_gain, avg_loss) arrays of the same length as `close`.
 
-    valid_data["avg_gain"] = np.nan
-    valid_data["avg_loss"] = np.nan
+    Without a seed the first `period` values are NaN. With a seed
+    (persisted state of the candle before close[0]) the smoothing simply
+    continues, so every value is defined.
+    """
+    rsi = np.full(len(close), np.nan)
+    avg_gain = np.full(len(close), np.nan)
+    avg_loss = np.full(len(close), np.nan)
 
-    # First SMA
-    valid_data.iloc[period, valid_data.columns.get_loc("avg_gain")] = \
-        valid_data["gain"].iloc[1:period+1].mean()
+    if seed is None:
+        if len(close) <= period:
+            return rsi, avg_gain, avg_loss
 
-    valid_data.iloc[period, valid_data.columns.get_loc("avg_loss")] = \
-        valid_data["loss"].iloc[1:period+1].mean()
+        change = np.diff(close)
+        gain = np.clip(change, 0, None)
+        loss = -np.clip(change, None, 0)
 
-    # Wilder smoothing
-    for i in range(period + 1, len(valid_data)):
-        valid_data.iloc[i, valid_data.columns.get_loc("avg_gain")] = (
-            (valid_data.iloc[i-1]["avg_gain"] * (period - 1)
-             + valid_data.iloc[i]["gain"]) / period
-        )
+        # First SMA over changes 1..period, then Wilder smoothing from there
+        avg_gain[period:] = wilder_smooth(gain[period - 1:], period, gain[:period].mean())
+        avg_loss[period:] = wilder_smooth(loss[period - 1:], period, loss[:period].mean())
+    else:
+        if len(close) == 0:
+            return rsi, avg_gain, avg_loss
 
-        valid_data.iloc[i, valid_data.columns.get_loc("avg_loss")] = (
-            (valid_data.iloc[i-1]["avg_loss"] * (period - 1)
-             + valid_data.iloc[i]["loss"]) / period
-        )
+        change = np.diff(close, prepend=seed["seed_close"])
+        gain = np.concatenate(([0.0], np.clip(change, 0, None)))
+        loss = np.concatenate(([0.0], -np.clip(change, None, 0)))
 
-    valid_data["rs"] = valid_data["avg_gain"] / valid_data["avg_loss"]
-    valid_data["rsi"] = 100 - (100 / (1 + valid_data["rs"]))
+        avg_gain[:] = wilder_smooth(gain, period, seed["rsi_avg_gain"])[1:]
+        avg_loss[:] = wilder_smooth(loss, period, seed["rsi_avg_loss"])[1:]
 
-    # Merge back into original dataframe
-    data["rsi"] = valid_data["rsi"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        rsi[:] = 100 - (100 / (1 + rs))
+    return rsi, avg_gain, avg_loss
 
-    return data
 
-def calculate_atr(data, period):
-    # data = data.copy()
+@METRICS.stage("calculate_rsi")
+def calculate_rsi(data, period, seed=None):
+    """
+    Adds rsi plus the Wilder accumulators (rsi_avg_gain, rsi_avg_loss) that
+    incremental runs persist. With a seed, only candles after
+    seed["seed_date"] are computed.
+    """
+    close = data["Close"].to_numpy(dtype=np.float64)
 
-    data["high_low"] = data["High"] - data["Low"]
-    data["high_close_prev"] = (data["High"] - data["Close"].shift()).abs()
-    data["low_close_prev"] = (data["Low"] - data["Close"].shift()).abs()
+    # Rows where Close is NaN are skipped for the calculation and stay NaN
+    valid = ~np.isnan(close)
+    if seed is not None:
+        valid &= (data["Date"] > pd.Timestamp(seed["seed_date"])).to_numpy()
 
-    data["tr"] = data[["high_low", "high_close_prev", "low_close_prev"]].max(axis=1)
-    data["atr"] = data["tr"].rolling(period).mean()
-    data["atr"] = data["atr"].fillna(0.0)
+    columns = [np.full(len(close), np.nan) for _ in range(3)]
+    for column, values in zip(columns, rsi_kernel(close[valid], period, seed)):
+        column[valid] = values
 
+    data["rsi"], data["rsi_avg_gain"], data["rsi_avg_loss"] = columns
+    return data
+
+@METRICS.stage("calculate_atr")
+def calculate_atr(data, period):
+    prev_close = data["Close"].shift()
+    # True range without helper columns; fmax skips NaN like max(axis=1)
+    tr = np.fmax(np.fmax(data["High"] - data["Low"], (data["High"] - prev_close).abs()), (data["Low"] - prev_close).abs())
+    data["atr"] = tr.rolling(period).mean().fillna(0.0)
     return data
 
 
+@METRICS.stage("calculate_roc")
 def calculate_roc(data, period):
-    # data = data.copy()
     data["roc"] = data["Close"].pct_change(periods=period, fill_method=None) * 100
     data["roc"] = data["roc"].fillna(0.0)
     return data
 
 
+@METRICS.stage("calculate_ma")
 def calculate_ma(data, ma_period, ma_type="sma"):
-    # data = data.copy()
     col = f"ma_{ma_period}"
 
     if ma_type == "sma":
@@ -93,223 +129,360 @@ def calculate_ma(data, ma_period, ma_type="sma"):
     return data
 
 
-def calculate_ma_crossover_flags(data):
-    # data = data.copy()
+def fill0(values):
+    # fillna(0.0) for arrays; unlike np.nan_to_num it keeps infinities
+    return np.where(np.isnan(values), 0.0, values)
 
-    data["ma_10_above_30"] = data["ma_10"] > data["ma_30"]
-    data["ma_30_above_40"] = data["ma_30"] > data["ma_40"]
-    data["ma_10_above_40"] = data["ma_10"] > data["ma_40"]
 
-    # Trend classification
-    data["trend"] = "sideways"
-    data.loc[(data["ma_10_above_30"]) & (data["ma_30_above_40"]), "trend"] = "bullish"
-    data.loc[(~data["ma_10_above_30"]) & (~data["ma_30_above_40"]), "trend"] = "bearish"
-
-    return data
-
-def calculate_52w_high_low(data, window=52):
+def _rolling(values, window, op):
     """
-    For weekly candles: 52 candles = 52 weeks = 1 year
+    op (np.fmax / np.fmin) over the last `window` rows of every row, like
+    rolling(window, min_periods=1) with NaNs skipped, in O(n) whole-array
+    passes (van Herk / Gil-Werman): running op forward and backward within
+    blocks of `window` rows, then one op per row across a block boundary.
+    Works on 1-D arrays and on 2-D (dates x tickers) panels.
     """
-    # data = data.copy()
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n == 0 or window <= 1:
+        return values.copy()
 
-    data["high_52w"] = data["High"].rolling(window=window, min_periods=1).max()
-    data["low_52w"] = data["Low"].rolling(window=window, min_periods=1).min()
+    # Leading NaN rows give the first rows their partial windows
+    pad = window - 1
+    blocks = -(-(n + pad) // window)
+    padded = np.full((blocks * window,) + values.shape[1:], np.nan)
+    padded[pad:pad + n] = values
 
-    data["dist_from_52w_high_pct"] = ((data["Close"] - data["high_52w"]) / data["high_52w"].replace(0, pd.NA)) * 100
-    data["dist_from_52w_low_pct"] = ((data["Close"] - data["low_52w"]) / data["low_52w"].replace(0, pd.NA)) * 100
+    shaped = padded.reshape((blocks, window) + values.shape[1:])
+    forward = op.accumulate(shaped, axis=1).reshape(padded.shape)
+    backward = op.accumulate(shaped[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    return op(backward[:n], forward[pad:pad + n])
 
-    data[["high_52w","low_52w","dist_from_52w_high_pct","dist_from_52w_low_pct"]] = \
-        data[["high_52w","low_52w","dist_from_52w_high_pct","dist_from_52w_low_pct"]].fillna(0.0)
 
-    return data
+def rolling_max(values, window):
+    return _rolling(values, window, np.fmax)
+
+
+def rolling_min(values, window):
+    return _rolling(values, window, np.fmin)
+
+
+# Trend codes of screen_kernel, indexing TREND_LABELS
+BEARISH, SIDEWAYS, BULLISH = 0, 1, 2
+TREND_LABELS = np.array(["bearish", "sideways", "bullish"])
+
+
+def trend_column(codes):
+    """
+    Categorical trend labels of 1-D screen_kernel codes: one byte per
+    candle instead of a string object.
+    """
+    return pd.Categorical.from_codes(codes, TREND_LABELS)
+
 
-def calculate_vcp_trend_template(data):
+def screen_kernel(close, high, low, ma_10, ma_30, ma_40, window=52):
     """
+    MA crossover flags, trend, 52 week high/low with the distances to them
+    and the VCP trend template, over float64 arrays (1-D, or 2-D dates x
+    tickers), without intermediate frames or object dtypes.
+    `window` is the timeframe's 52 week window in candles; the MAs are
+    filled with 0 already, prices may hold NaN.
+
     VCP Trend Template:
     - At least 30% above 52W low
     - At most 25% below 52W high
     - MA trend bullish (10 > 30 > 40)
     - Price above 30W and 40W MA
+
+    Returns {field: array}, with 0 / False defaults filled in (a 0 high or
+    low gives a 0 distance). The trend is left as int8 codes (see
+    trend_column).
     """
+    return screens(close, rolling_max(high, window), rolling_min(low, window), ma_10, ma_30, ma_40)
 
-    data["price_above_ma_30"] = data["Close"] > data["ma_30"]
-    data["price_above_ma_40"] = data["Close"] > data["ma_40"]
 
-    data["vcp_trend_template"] = (
-        (data["dist_from_52w_low_pct"] >= 30) &
-        (data["dist_from_52w_high_pct"] >= -25) &
-        (data["trend"] == "bullish") &
-        (data["price_above_ma_30"]) &
-        (data["price_above_ma_40"])
+def screens(close, high_52w, low_52w, ma_10, ma_30, ma_40):
+    """
+    screen_kernel on 52 week high/low computed already (NaN where
+    undefined), e.g. by streaming.IndicatorStream.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    out = {
+        "ma_10_above_30": ma_10 > ma_30,
+        "ma_30_above_40": ma_30 > ma_40,
+        "ma_10_above_40": ma_10 > ma_40,
+    }
+    bullish = out["ma_10_above_30"] & out["ma_30_above_40"]
+    bearish = ~(out["ma_10_above_30"] | out["ma_30_above_40"])
+    code = np.full(close.shape, SIDEWAYS, dtype=np.int8)
+    code[bullish] = BULLISH
+    code[bearish] = BEARISH
+    out["trend"] = code
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dist_high = (close - high_52w) / np.where(high_52w == 0, np.nan, high_52w) * 100
+        dist_low = (close - low_52w) / np.where(low_52w == 0, np.nan, low_52w) * 100
+
+    out["high_52w"] = fill0(high_52w)
+    out["low_52w"] = fill0(low_52w)
+    out["dist_from_52w_high_pct"] = fill0(dist_high)
+    out["dist_from_52w_low_pct"] = fill0(dist_low)
+
+    # NaN closes compare False, as in the frame version
+    out["vcp_trend_template"] = (
+        (out["dist_from_52w_low_pct"] >= 30) &
+        (out["dist_from_52w_high_pct"] >= -25) &
+        bullish &
+        (close > ma_30) &
+        (close > ma_40)
     )
+    return out
 
+
+@METRICS.stage("calculate_screens")
+def calculate_screens(data, window=52):
+    """
+    Adds the screen_kernel columns (MA flags, trend, 52 week metrics, VCP)
+    to a frame that has the MAs. `window`: 52 candles = 52 weeks = 1 year
+    on weekly candles (252 daily or 12 monthly, see Constant.timeframes).
+    """
+    out = screen_kernel(
+        data["Close"].to_numpy(dtype=np.float64),
+        data["High"].to_numpy(dtype=np.float64),
+        data["Low"].to_numpy(dtype=np.float64),
+        data["ma_10"].to_numpy(), data["ma_30"].to_numpy(), data["ma_40"].to_numpy(),
+        window
+    )
+    out["trend"] = trend_column(out["trend"])
+    for field, values in out.items():
+        data[field] = values
     return data
 
 
+@METRICS.stage("calculate_benchmark_roc")
+def calculate_benchmark_roc(data, benchmarks=()):
+    """
+    Benchmark ROC, looked up on the candle dates (see benchmarks.get_benchmarks).
+    """
+    for field, values in benchmark_columns(benchmarks, data["Date"]).items():
+        data[field] = values
+    return data
 
 
+def _moving_averages(data, timeframe, *_):
+    for p in MA_PERIODS:
+        data = calculate_ma(data, p)
+    return data
 
-# ================= FULL BULK INDEX ================= #
 
-def index_data(index_name, data, ticker, nifty_data=None):
-    es = get_es_client()
-    logger.info(f"Indexing stock = {ticker}")
+# Frame computation of every indicator of indicators.INDICATORS, by name:
+# step(data, timeframe, benchmarks, rsi_seed) adds the indicator's outputs
+FRAME_STEPS = {
+    "rsi": lambda data, tf, benchmarks, seed: calculate_rsi(data, tf.rsi_window, seed),
+    "roc": lambda data, tf, *_: calculate_roc(data, tf.roc_period),
+    "benchmark_roc": lambda data, tf, benchmarks, seed: calculate_benchmark_roc(data, benchmarks),
+    "atr": lambda data, tf, *_: calculate_atr(data, tf.atr_period),
+    "ma": _moving_averages,
+    "screens": lambda data, tf, *_: calculate_screens(data, tf.high_low_window),
+}
 
-    if not es.indices.exists(index=index_name):
-        es.indices.create(index=index_name, body=index_mapping)
 
+# ================= FULL BULK INDEX ================= #
+
+@METRICS.stage("compute_indicators")
+def compute_indicators(data, benchmarks=(), rsi_seed=None, timeframe=WEEKLY, names=None):
+    """
+    Sort a single-ticker frame by date, add every indicator column and fill
+    the defaults the documents expect.
+    `benchmarks` are prepared once per run (see benchmarks.get_benchmarks);
+    `rsi_seed` continues RSI from persisted state (see index_state);
+    `timeframe` sets the indicator windows of these candles;
+    `names` limits the work to those indicators (with their inputs, see
+    indicators.required_indicators).
+    The caller's frame is left as it is: sorting makes the one copy the
+    indicators are then added to in place. With float32 prices
+    (data_fetcher.downcast_prices) the indicators are kept as float32 too.
+    """
     # Sort by date
+    data = data.sort_values("Date", key=lambda dates: pd.to_datetime(dates, errors="coerce"))
     data["Date"] = pd.to_datetime(data["Date"], errors="coerce")
-    data = data.sort_values("Date")
 
-    # Indicators
-    data = data.copy()
-    data = calculate_atr(data, atr_period)
-    data = calculate_rsi(data, rsi_window)
-    data = calculate_roc(data, roc_period)
+    # Indicators, in registry order
+    for indicator in INDICATORS:
+        if names is None or indicator.name in names:
+            data = FRAME_STEPS[indicator.name](data, timeframe, benchmarks, rsi_seed)
+    data = fill_defaults(data)
+    if data["Close"].dtype == np.float32:
+        downcast_indicators(data)
+    return data
+
+
+def fill_defaults(data):
+    """
+    Fills the defaults the documents expect (see indicators.defaults), once
+    the indicator columns are there, in place.
+    """
+    logger.debug(f"demerger = {data._mgr.nblocks}")
+    data.fillna(defaults(), inplace=True)
+    return data
 
-    for p in [10, 30, 40]:
-        data = calculate_ma(data, p)
 
-    data = calculate_ma_crossover_flags(data)
-    data = calculate_52w_high_low(data)
-    data = calculate_vcp_trend_template(data)
-
-    data = data.copy()
-    logger.info(f"demerger = {data._mgr.nblocks}")
-
-    # NIFTY ROC merge
-    if nifty_data is not None:
-        nifty_data["Date"] = pd.to_datetime(nifty_data["Date"], errors="coerce")
-        nifty_data = nifty_data.sort_values("Date")
-        nifty_data = calculate_roc(nifty_data, roc_period)
-        nifty_data.rename(columns={"roc": "roc_nifty"}, inplace=True)
-        data = pd.merge(data, nifty_data[["Date", "roc_nifty"]], on="Date", how="left")
-
-    # Fill defaults
-    data.fillna({
-        "Open": 0.0, "Close": 0.0, "High": 0.0, "Low": 0.0, "Volume": 0,
-        "rsi": 0.0, "roc": 0.0, "roc_nifty": 0.0, "atr": 0.0,
-        "ma_10": 0.0, "ma_30": 0.0, "ma_40": 0.0,
-        "ma_10_above_30": False, "ma_30_above_40": False, "ma_10_above_40": False,
-        "trend": "sideways",
-        "high_52w": 0.0,
-        "low_52w": 0.0,
-        "dist_from_52w_high_pct": 0.0,
-        "dist_from_52w_low_pct": 0.0,
-        "vcp_trend_template": False,
-        "type": "stock", "isCustom": False
-    }, inplace=True)
-
-    def actions():
-        for _, r in data.iterrows():
-            if r["Open"] == 0:
-                continue
-
-            date = r["Date"].strftime("%Y-%m-%d")
-
-            yield {
-                "_op_type": "index",
-                "_index": index_name,
-                "_id": f"{ticker}_{date}",
-                "_source": {
-                    "ticker": ticker,
-                    "date": date,
-                    "open": float(r["Open"]),
-                    "close": float(r["Close"]),
-                    "high": float(r["High"]),
-                    "low": float(r["Low"]),
-                    "volume": int(r["Volume"]),
-                    "rsi": float(r["rsi"]),
-                    "roc": float(r["roc"]),
-                    "roc_nifty": float(r["roc_nifty"]),
-                    "atr": float(r["atr"]),
-                    "ma_10": float(r["ma_10"]),
-                    "ma_30": float(r["ma_30"]),
-                    "ma_40": float(r["ma_40"]),
-                    "ma_10_above_30": bool(r["ma_10_above_30"]),
-                    "ma_30_above_40": bool(r["ma_30_above_40"]),
-                    "ma_10_above_40": bool(r["ma_10_above_40"]),
-                    "trend": r["trend"],
-                    "high_52w": float(r["high_52w"]),
-                    "low_52w": float(r["low_52w"]),
-                    "dist_from_52w_high_pct": float(r["dist_from_52w_high_pct"]),
-                    "dist_from_52w_low_pct": float(r["dist_from_52w_low_pct"]),
-                    "vcp_trend_template": bool(r["vcp_trend_template"]),
-                    "indices": r["indices"],
-                    "type": r["type"],
-                    "isCustom": r["isCustom"]
-                }
-            }
-
-    logger.info(f"demerger 2 = {data._mgr.nblocks}")
-    helpers.bulk(es, actions(), raise_on_error=True)
+# Kept as float64 by low-memory runs: the Wilder averages an incremental
+# run continues from, and share volumes (see data_fetcher.downcast_prices)
+EXACT_COLUMNS = ("rsi_avg_gain", "rsi_avg_loss", "Volume")
+
+
+def downcast_indicators(columns):
+    """
+    Replaces the float64 columns of a frame, or of a {column: array} dict
+    (1-D or 2-D arrays), by float32 ones in place, except EXACT_COLUMNS.
+    """
+    for name, values in list(columns.items()):
+        if name not in EXACT_COLUMNS and values.dtype == np.float64:
+            columns[name] = np.asarray(values, dtype=np.float32)
+    return columns
+
+
+def prepare_ticker(data, ticker, benchmarks=(), timeframe=WEEKLY, metadata=None):
+    """
+    Compute and serialize one ticker without touching Elasticsearch.
+    `metadata` holds the ticker's {"indices", "type", "isCustom"}, written
+    into every document at serialization (without it `data` must carry
+    them as columns).
+    Returns (ticker, [(doc_id, encoded _source)], state); everything in it
+    is picklable so it can run in a worker process.
+    """
+    computed = compute_indicators(data, benchmarks, timeframe=timeframe)
+    # `data` is left as it was, so its prices still hold their NaNs
+    prices = data.loc[computed.index, ["High", "Low", "Close"]]
+    state = build_state(ticker, computed, prices=prices, timeframe=timeframe)
+    return ticker, serialize_documents(computed, ticker, metadata=metadata), state
+
+
+def index_data(index_name, data, ticker, benchmarks=(), sink=None, timeframe=WEEKLY, metadata=None):
+    """
+    Full rebuild of one ticker. Returns its state for incremental runs.
+    With an offline sink (file_sink.FileSink) Elasticsearch is not touched.
+    """
+    sink = sink or BulkSink()
+    logger.info(f"Indexing stock = {ticker}")
+    if sink.es is not None:
+        ensure_candle_index(index_name, sink.es, timeframe.partition_years)
+
+    _, docs, state = prepare_ticker(data, ticker, benchmarks, timeframe, metadata)
+    sink.send(doc_actions(index_name, docs, timeframe.partition_years))
+    return state
 
 
 # ================= INCREMENTAL INDEX ================= #
 
-# def index_data_incremental(index_name, data, ticker, nifty_data=None):
-#     es = get_es_client()
-#     logger.info(f"Incremental indexing {ticker}")
-#
-#     if not es.indices.exists(index=index_name):
-#         es.indices.create(index=index_name, body=index_mapping)
-#
-#     data["Date"] = pd.to_datetime(data["Date"], errors="coerce")
-#     data = data.sort_values("Date")
-#
-#     # Indicators
-#     data = data.copy()
-#     data = calculate_atr(data, atr_period)
-#     data = calculate_rsi(data, rsi_window)
-#     data = calculate_roc(data, roc_period)
-#
-#     for p in [10, 30, 40]:
-#         data = calculate_ma(data, p)
-#
-#     data = calculate_ma_crossover_flags(data)
-#     data = calculate_52w_high_low(data)
-#
-#     data = data.copy()
-#     logger.info(f"demerger = {data._mgr.nblocks}")
-#
-#     # NIFTY ROC
-#     if nifty_data is not None:
-#         nifty_data["Date"] = pd.to_datetime(nifty_data["Date"], errors="coerce")
-#         nifty_data = nifty_data.sort_values("Date")
-#         nifty_data = calculate_roc(nifty_data, roc_period)
-#         nifty_data.rename(columns={"roc": "roc_nifty"}, inplace=True)
-#         data = pd.merge(data, nifty_data[["Date", "roc_nifty"]], on="Date", how="left")
-#
-#     # Only last 5 rows
-#     data = data.tail(5)
-#
-#     def actions():
-#         for _, r in data.iterrows():
-#             date = r["Date"].strftime("%Y-%m-%d")
-#             doc = {}
-#
-#             for f in ["Open","Close","High","Low","Volume","rsi","roc","roc_nifty","atr","ma_10","ma_30","ma_40","high_52w","low_52w","dist_from_52w_high_pct","dist_from_52w_low_pct"]:
-#                 if pd.isna(r[f]) or r[f] == 0:
-#                     continue
-#                 doc[f.lower()] = float(r[f]) if isinstance(r[f], float) else int(r[f])
-#
-#             # booleans + trend
-#             doc["ma_10_above_30"] = bool(r["ma_10_above_30"])
-#             doc["ma_30_above_40"] = bool(r["ma_30_above_40"])
-#             doc["ma_10_above_40"] = bool(r["ma_10_above_40"])
-#             doc["trend"] = r["trend"]
-#
-#             doc["ticker"] = ticker
-#             doc["date"] = date
-#
-#             yield {
-#                 "_op_type": "update",
-#                 "_index": index_name,
-#                 "_id": f"{ticker}_{date}",
-#                 "doc": doc,
-#                 "doc_as_upsert": True
-#             }
-#
-#     helpers.bulk(es, actions(), raise_on_error=True)
+def index_data_incremental(index_name, data, ticker, benchmarks, state, sink=None, timeframe=WEEKLY, metadata=None):
+    """
+    `data` only covers the lookback window before state["seed_date"].
+    RSI continues from the persisted seed, the window feeds the rolling
+    indicators, and only candles after the seed are re-indexed.
+    `metadata` as in prepare_ticker. Returns the new state.
+    """
+    es = get_es_client()
+    logger.info(f"Incremental indexing {ticker} after {state['seed_date']}")
+    ensure_candle_index(index_name, es, timeframe.partition_years)
+
+    computed = compute_indicators(data, benchmarks, rsi_seed=state, timeframe=timeframe)
+    changed = computed[computed["Date"] > pd.Timestamp(state["seed_date"])]
+
+    sink = sink or BulkSink(es)
+    success = sink.send(build_actions(index_name, changed, ticker, timeframe.partition_years, metadata))
+    logger.info(f"Upserted {success} candles for {ticker}")
+    prices = data.loc[computed.index, ["High", "Low", "Close"]]
+    return build_state(ticker, computed, previous=state, prices=prices, timeframe=timeframe)
+
+
+# ================= STREAMING INDEX ================= #
+
+@METRICS.stage("stream_indicators", count=lambda result, dates, *args: {"rows": len(dates)})
+def stream_indicators(dates, prices, stream, benchmarks=()):
+    """
+    Every indicator of compute_indicators for the candles following a
+    stream's state, updated candle by candle from `stream`
+    (streaming.IndicatorStream) without any history or frame.
+    `prices` maps the OHLCV fields to 1-D arrays along the sorted `dates`.
+    Returns ({frame column: 1-D array} with the defaults filled, as
+    panel.compute_panel, and the snapshots of streaming.stream_arrays).
+    """
+    close = np.asarray(prices["Close"], dtype=np.float64)
+    raw, snapshots = stream_arrays(
+        stream, np.asarray(prices["High"], dtype=np.float64), np.asarray(prices["Low"], dtype=np.float64), close
+    )
+
+    out = {field: fill0(raw[field]) for field in ("atr", "rsi", "roc")}
+    out["rsi_avg_gain"], out["rsi_avg_loss"] = raw["rsi_avg_gain"], raw["rsi_avg_loss"]
+    for p in MA_PERIODS:
+        out[f"ma_{p}"] = fill0(raw[f"ma_{p}"])
+    out.update(screens(close, raw["high_52w"], raw["low_52w"], out["ma_10"], out["ma_30"], out["ma_40"]))
+    out.update(benchmark_columns(benchmarks, dates))
+
+    for field, values in prices.items():
+        out[field] = fill0(np.asarray(values, dtype=np.float64))
+    return out, snapshots
+
+
+def stream_ticker(data, ticker, state, benchmarks=(), timeframe=WEEKLY, metadata=None):
+    """
+    Streaming counterpart of prepare_ticker for an incremental run: only
+    the candles of `data` after state["seed_date"] are read and computed
+    from the state's indicator stream, O(1) per candle. `metadata` holds
+    the ticker's {"indices", "type", "isCustom"}.
+    Returns ([(doc_id, encoded _source)], new state), or None when the
+    state has no stream usable on `timeframe` (see
+    streaming.IndicatorStream.from_state).
+    """
+    stream = IndicatorStream.from_state(state.get("stream"), timeframe)
+    if stream is None:
+        return None
+
+    dates = data["Date"].to_numpy(dtype="datetime64[ns]")
+    rows = np.flatnonzero(dates > np.datetime64(state["seed_date"]))
+    if not len(rows):
+        # Nothing traded since the seed candle
+        return [], state
+    rows = rows[np.argsort(dates[rows], kind="stable")]
+    dates = dates[rows]
+    prices = {field: data[field].to_numpy(dtype=np.float64)[rows] for field in ("Open", "High", "Low", "Close", "Volume")}
+
+    columns, snapshots = stream_indicators(dates, prices, stream, benchmarks)
+    columns["trend"] = trend_column(columns["trend"])
+    days = np.datetime_as_string(dates, unit="D").astype(object)
+    docs = serialize_columns(ticker, days, columns, metadata)
+
+    # The seed candle leads, as in the lookback window of index_data_incremental
+    snapshots = {row + 1: s for row, s in snapshots.items()}
+    snapshots[0] = state["stream"]
+    state = state_from_arrays(
+        ticker,
+        np.concatenate(([np.datetime64(state["seed_date"], "ns")], dates)),
+        np.concatenate(([state["seed_close"]], columns["Close"])),
+        np.concatenate(([state["rsi_avg_gain"]], columns["rsi_avg_gain"])),
+        np.concatenate(([state["rsi_avg_loss"]], columns["rsi_avg_loss"])),
+        previous=state, stream=snapshots.get
+    )
+    return docs, state
+
+
+def index_data_streaming(index_name, data, ticker, benchmarks, state, sink=None, timeframe=WEEKLY, metadata=None):
+    """
+    Incremental run of a ticker from the indicator stream in its state
+    (see stream_ticker). Returns the new state, or None when the stream
+    cannot be used and index_data_incremental applies.
+    """
+    result = stream_ticker(data, ticker, state, benchmarks, timeframe, metadata)
+    if result is None:
+        return None
+    docs, new_state = result
+
+    es = get_es_client()
+    logger.info(f"Streaming {ticker} after {state['seed_date']}")
+    ensure_candle_index(index_name, es, timeframe.partition_years)
+
+    success = (sink or BulkSink(es)).send(doc_actions(index_name, docs, timeframe.partition_years))
+    logger.info(f"Upserted {success} candles for {ticker}")
+    return new_state
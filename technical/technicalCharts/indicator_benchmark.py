@@ -0,0 +1,277 @@
+"""
+Benchmark suite for the indicator pipeline.
+
+Generates deterministic synthetic universes of daily bars (e.g. 50, 750
+and 5000 tickers x 20 years), resamples them to each timeframe and times,
+per universe and timeframe:
+- every indicator step of compute_indicators (calculate_rsi, calculate_roc, ...,
+  one per entry of indicators.INDICATORS)
+- compute_indicators as a whole and serialize_documents
+- prepare_ticker + encoding the bulk actions, i.e. index_data without the
+  network (or index_data itself against Constant.host with --index)
+- the panel engine (prepare_panel) and the resampler
+- stream_ticker: an incremental refresh of the last candle from the
+  persisted indicator stream (see streaming.py)
+
+Results are written as JSON; --compare flags stages that got slower than a
+previous results file.
+
+Run from this directory:
+    python indicator_benchmark.py --tickers 50 750 5000 --output bench.json
+    python indicator_benchmark.py --tickers 50 --compare bench.json
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import Constant
+from benchmarks import prepare_benchmark
+from bulk_sink import BulkSink
+from data_fetcher import resample, to_long
+from full_indexing import iter_ticker_frames
+from index_state import build_state
+from indexer import FRAME_STEPS, compute_indicators, index_data, prepare_ticker, stream_ticker
+from indicators import INDICATORS
+from panel import DEFAULT_METADATA, prepare_panel
+from serializer import doc_actions, serialize_documents
+from timeframes import get_timeframe
+
+SEED = 2024
+TRADING_DAYS = 252
+# Generator stream of the synthetic benchmark, above any ticker number
+BENCHMARK_STREAM = 10 ** 6
+
+
+# ================= SYNTHETIC DATA ================= #
+
+def synthetic_daily(rng, days):
+    """
+    One ticker's daily OHLCV: a random walk with a late listing, suspended
+    days (NaN) and a flat stretch, like the real universe has.
+    """
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0004, 0.02, days)))
+    flat = rng.integers(0, days - 20)
+    close[flat:flat + 20] = close[flat]
+    open_ = close * (1 + rng.normal(0, 0.005, days))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.015, days))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.015, days))
+    volume = rng.integers(10_000, 5_000_000, days).astype(np.float64)
+
+    listed = rng.integers(0, days // 3) if rng.random() < 0.3 else 0
+    suspended = rng.random(days) < 0.005
+    bars = {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}
+    for values in bars.values():
+        values[:listed] = np.nan
+        values[suspended] = np.nan
+    return bars
+
+
+def trading_days(years):
+    return pd.bdate_range(end="2025-12-31", periods=years * TRADING_DAYS)
+
+
+def synthetic_batches(count, years, seed=SEED, batch_size=Constant.batch_size):
+    """
+    Yields (tickers, wide daily frame) batches of a universe of `count`
+    tickers. Every ticker has its own seeded generator, so a ticker's bars
+    do not depend on the universe size or batch size.
+    """
+    dates = trading_days(years)
+    for start in range(0, count, batch_size):
+        tickers = [f"SYN{i:05d}.NS" for i in range(start, min(start + batch_size, count))]
+        columns = {}
+        for i, ticker in zip(range(start, count), tickers):
+            for field, values in synthetic_daily(np.random.default_rng([seed, i]), len(dates)).items():
+                columns[f"{ticker}/{field}"] = values
+        frame = pd.DataFrame(columns)
+        frame.insert(0, "Date", dates)
+        yield tickers, frame
+
+
+def synthetic_benchmark(years, timeframe, seed=SEED):
+    daily = pd.DataFrame({
+        "Date": trading_days(years),
+        "Close/^NSEI": synthetic_daily(np.random.default_rng([seed, BENCHMARK_STREAM]), years * TRADING_DAYS)["Close"],
+    })
+    candles = resample(daily, timeframe.anchor)
+    frame = pd.DataFrame({"Date": candles["Date"], "Close": candles["Close/^NSEI"]})
+    return (prepare_benchmark("^NSEI", "roc_nifty", frame, timeframe.roc_period),)
+
+
+# ================= TIMING ================= #
+
+class Timer:
+    """
+    Accumulates seconds and call counts per stage.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def __call__(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.seconds[stage] += time.perf_counter() - start
+        self.calls[stage] += 1
+        return result
+
+
+def indicator_steps(timeframe, benchmarks=()):
+    """
+    compute_indicators broken into the steps of the indicator registry, in
+    order (later steps read the columns earlier ones add).
+    """
+    return [
+        (f"calculate_{indicator.name}", lambda d, step=FRAME_STEPS[indicator.name]: step(d, timeframe, benchmarks, None))
+        for indicator in INDICATORS
+    ]
+
+
+def dry_index_data(data, ticker, benchmarks, timeframe, metadata):
+    """
+    index_data minus the network: compute, serialize and drain the bulk
+    actions the way the sink would.
+    """
+    _, docs, _ = prepare_ticker(data, ticker, benchmarks, timeframe, metadata)
+    return sum(len(action["_source"]) for action in doc_actions(timeframe.index_name, docs))
+
+
+def run_universe(count, years, timeframe, index_name=None):
+    """
+    Times every stage over a universe; returns {stage: {...}}.
+    """
+    timer = Timer()
+    benchmarks = synthetic_benchmark(years, timeframe)
+    steps = indicator_steps(timeframe, benchmarks)
+    candles_total = docs_total = 0
+    sink = BulkSink() if index_name else None
+
+    for tickers, daily in synthetic_batches(count, years):
+        candles = timer("resample", resample, daily, timeframe.anchor)
+        metadata = {t: DEFAULT_METADATA for t in tickers}
+        timer("prepare_panel", prepare_panel, candles, tickers, benchmarks, metadata, timeframe)
+
+        for ticker, data in iter_ticker_frames(to_long(candles, tickers)):
+            candles_total += len(data)
+
+            stepped = data.copy()
+            for stage, step in steps:
+                stepped = timer(stage, step, stepped)
+
+            computed = timer("compute_indicators", compute_indicators, data, benchmarks, None, timeframe)
+            docs = timer("serialize_documents", serialize_documents, computed, ticker, None, DEFAULT_METADATA)
+            docs_total += len(docs)
+
+            prices = data[["High", "Low", "Close"]].loc[computed.index]
+            state = build_state(ticker, computed, prices=prices, timeframe=timeframe)
+            if state is not None:
+                timer("stream_ticker", stream_ticker, data, ticker, state, benchmarks, timeframe, DEFAULT_METADATA)
+
+            if sink is not None:
+                timer("index_data", index_data, index_name, data, ticker, benchmarks, sink, timeframe, DEFAULT_METADATA)
+            else:
+                timer("index_data", dry_index_data, data, ticker, benchmarks, timeframe, DEFAULT_METADATA)
+
+    results = {}
+    for stage, seconds in timer.seconds.items():
+        results[stage] = {
+            "seconds": round(seconds, 6),
+            "calls": timer.calls[stage],
+            "ms_per_ticker": round(seconds * 1000 / count, 4),
+            "candles_per_sec": round(candles_total / seconds) if seconds else None,
+        }
+    results["_universe"] = {"tickers": count, "candles": candles_total, "docs": docs_total}
+    return results
+
+
+# ================= REPORTING ================= #
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous, threshold):
+    """
+    Prints per-stage ratios against a previous results file; returns the
+    number of stages slower by more than `threshold` (e.g. 0.2 = 20%).
+    """
+    regressions = 0
+    for key, stages in current["results"].items():
+        old_stages = previous["results"].get(key)
+        if old_stages is None:
+            continue
+        for stage, result in stages.items():
+            old = old_stages.get(stage)
+            if stage.startswith("_") or old is None or not old["seconds"]:
+                continue
+            ratio = result["seconds"] / old["seconds"]
+            slower = ratio > 1 + threshold
+            regressions += slower
+            print(f"{'SLOWER' if slower else 'ok    '} {key:<14} {stage:<30} {ratio:5.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indicator benchmark on synthetic universes")
+    parser.add_argument("--tickers", type=int, nargs="+", default=[50, 750, 5000], help="universe sizes")
+    parser.add_argument("--years", type=int, default=20, help="years of daily bars per ticker")
+    parser.add_argument("--timeframes", nargs="+", choices=list(Constant.timeframes), default=["daily", "weekly"])
+    parser.add_argument("--output", default="indicator_benchmark.json", help="where to write the results")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    parser.add_argument("--index", help="run the real index_data into this (throwaway) index on Constant.host")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "years": args.years,
+            "seed": SEED,
+            "batch_size": Constant.batch_size,
+            "index": args.index,
+        },
+        "results": {}
+    }
+
+    for count in args.tickers:
+        for name in args.timeframes:
+            key = f"{count}/{name}"
+            start = time.perf_counter()
+            report["results"][key] = results = run_universe(count, args.years, get_timeframe(name), args.index)
+            print(f"{key}: {results['_universe']['candles']:,} candles in {time.perf_counter() - start:.1f}s")
+            for stage, result in sorted(results.items()):
+                if not stage.startswith("_"):
+                    print(f"  {stage:<30} {result['seconds']:9.3f}s  {result['ms_per_ticker']:8.3f} ms/ticker")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"compared with {args.compare} (commit {previous['meta'].get('commit')})")
+        return 1 if compare(report, previous, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
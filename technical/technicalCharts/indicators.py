@@ -0,0 +1,228 @@
+"""
+Registry of the indicators written into the candle documents.
+
+Each Indicator declares the frame columns it reads, the document fields it
+writes (JSON kind, Elasticsearch type and default), its parameters on a
+timeframe, the candles of history a value needs, and a version. From the
+registry follow the serializer's field list, the candle index mappings,
+the fetch window of incremental runs and the fingerprints recompute.py
+compares to rewrite only the fields of indicators that changed.
+
+The engines hold the computation of each indicator under its name
+(indexer.FRAME_STEPS, panel.PANEL_STEPS). Bump an indicator's version
+whenever its output changes for the same parameters.
+"""
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+import Constant
+
+# Moving averages of the "ma" indicator; the screens compare these three
+MA_PERIODS = (10, 30, 40)
+
+
+class Field(NamedTuple):
+    """
+    One document field: its name, the frame column holding it (default:
+    the same name), the serializer's JSON kind ("float", "int", "bool",
+    "json"), its Elasticsearch type, whether consumers query it (kept
+    indexed, at 2 decimals, by the optimized mapping) and its default for
+    missing values.
+    """
+    name: str
+    kind: str = "float"
+    es_type: str = "float"
+    queried: bool = False
+    default: Any = 0.0
+    column: Optional[str] = None
+
+    @property
+    def frame_column(self):
+        return self.column or self.name
+
+
+class Indicator(NamedTuple):
+    """
+    `params(timeframe)` and `lookback(timeframe)` (candles before a candle
+    that its value reads) are functions of the timeframe. `columns` are
+    frame columns it adds besides its fields, e.g. state for incremental
+    runs.
+    """
+    name: str
+    version: int
+    inputs: Tuple[str, ...]
+    fields: Tuple[Field, ...]
+    params: Callable
+    lookback: Callable
+    columns: Tuple[str, ...] = ()
+
+    @property
+    def outputs(self):
+        return tuple(f.frame_column for f in self.fields) + self.columns
+
+
+# Document fields around the indicators: candle values first, per-ticker metadata last
+CANDLE_FIELDS = (
+    Field("open", column="Open"),
+    Field("close", queried=True, column="Close"),
+    Field("high", column="High"),
+    Field("low", column="Low"),
+    Field("volume", "int", "long", default=0, column="Volume"),
+)
+METADATA_FIELDS = (
+    Field("indices", "json", "keyword", queried=True, default=None),
+    Field("type", "json", "keyword", queried=True, default="stock"),
+    Field("isCustom", "json", "boolean", queried=True, default=False),
+)
+
+
+def _flag(name):
+    return Field(name, "bool", "boolean", queried=True, default=False)
+
+
+# In document order; an indicator may read the outputs of earlier ones
+INDICATORS = [
+    Indicator(
+        "rsi", 1, ("Close",), (Field("rsi", queried=True),),
+        params=lambda tf: {"window": tf.rsi_window},
+        # Wilder smoothing continues from the RSI seed of the persisted state
+        lookback=lambda tf: 1,
+        columns=("rsi_avg_gain", "rsi_avg_loss"),
+    ),
+    Indicator(
+        "roc", 1, ("Close",), (Field("roc", queried=True),),
+        params=lambda tf: {"period": tf.roc_period},
+        lookback=lambda tf: tf.roc_period,
+    ),
+    Indicator(
+        "benchmark_roc", 1, ("Date",), tuple(Field(field) for field in Constant.benchmarks.values()),
+        params=lambda tf: {"benchmarks": dict(Constant.benchmarks), "period": tf.roc_period},
+        # Looked up on the candle date in benchmarks prepared separately
+        lookback=lambda tf: 0,
+    ),
+    Indicator(
+        "atr", 1, ("High", "Low", "Close"), (Field("atr"),),
+        params=lambda tf: {"period": tf.atr_period},
+        lookback=lambda tf: tf.atr_period,
+    ),
+    Indicator(
+        "ma", 1, ("Close",), tuple(Field(f"ma_{p}") for p in MA_PERIODS),
+        params=lambda tf: {"periods": list(MA_PERIODS)},
+        lookback=lambda tf: max(MA_PERIODS) - 1,
+    ),
+    Indicator(
+        "screens", 1, ("Close", "High", "Low", "ma_10", "ma_30", "ma_40"),
+        (
+            _flag("ma_10_above_30"), _flag("ma_30_above_40"), _flag("ma_10_above_40"),
+            Field("trend", "json", "keyword", queried=True, default="sideways"),
+            Field("high_52w"), Field("low_52w"),
+            Field("dist_from_52w_high_pct", queried=True), Field("dist_from_52w_low_pct", queried=True),
+            _flag("vcp_trend_template"),
+        ),
+        params=lambda tf: {"window": tf.high_low_window},
+        lookback=lambda tf: tf.high_low_window - 1,
+    ),
+]
+
+
+def get_indicator(name):
+    for indicator in INDICATORS:
+        if indicator.name == name:
+            return indicator
+    raise KeyError(f"No indicator {name!r} (registered: {[i.name for i in INDICATORS]})")
+
+
+def doc_fields():
+    """
+    Every document field after ticker and date, in output order.
+    """
+    return CANDLE_FIELDS + tuple(f for indicator in INDICATORS for f in indicator.fields) + METADATA_FIELDS
+
+
+def defaults():
+    """
+    {frame column: default} the documents expect for missing values.
+    """
+    return {f.frame_column: f.default for f in doc_fields() if f.default is not None}
+
+
+def fetch_lookback(timeframe):
+    """
+    Candles of history needed before the first candle an incremental run
+    recomputes: the longest lookback of the registry.
+    """
+    return max(indicator.lookback(timeframe) for indicator in INDICATORS)
+
+
+# ================= MAPPINGS ================= #
+
+_SCALED = {"type": "scaled_float", "scaling_factor": 100}
+
+
+def field_mapping(field, profile="default"):
+    """
+    Elasticsearch mapping of a document field. The optimized profile keeps
+    prices and percentages as scaled_float with 2 decimals in doc values
+    (_source keeps the exact values), and indexes only queried fields.
+    """
+    if profile != "optimized" or field.es_type in ("keyword", "boolean"):
+        return {"type": field.es_type}
+    if field.es_type == "float":
+        return dict(_SCALED) if field.queried else {**_SCALED, "index": False}
+    return {"type": field.es_type} if field.queried else {"type": field.es_type, "index": False}
+
+
+def mapping_properties(profile="default", fields=None):
+    """
+    Mapping properties of the candle documents (or of `fields` only).
+    """
+    properties = {} if fields is not None else {"date": {"type": "date"}, "ticker": {"type": "keyword"}}
+    for field in fields if fields is not None else doc_fields():
+        properties[field.name] = field_mapping(field, profile)
+    return properties
+
+
+# ================= VERSIONS ================= #
+
+def fingerprints(timeframe):
+    """
+    {indicator: {"version", "params"}} on `timeframe`; a document written
+    under other fingerprints holds stale values of that indicator.
+    """
+    return {
+        indicator.name: {"version": indicator.version, "params": indicator.params(timeframe)}
+        for indicator in INDICATORS
+    }
+
+
+def changed_indicators(stored, current):
+    """
+    Names of the indicators whose fingerprint in `stored` differs from
+    `current` (or is missing), plus every later indicator reading their
+    outputs, in registry order.
+    """
+    changed = {name for name, fingerprint in current.items() if (stored or {}).get(name) != fingerprint}
+    stale_columns = set()
+    out = []
+    for indicator in INDICATORS:
+        if indicator.name in changed or stale_columns & set(indicator.inputs):
+            out.append(indicator.name)
+            stale_columns.update(indicator.outputs)
+    return out
+
+
+def required_indicators(names):
+    """
+    `names` plus every earlier indicator producing their inputs, in
+    registry order.
+    """
+    needed = set()
+    for indicator in INDICATORS:
+        if indicator.name in names:
+            needed.update(indicator.inputs)
+    # Walking backwards pulls in the producers of producers
+    out = []
+    for indicator in reversed(INDICATORS):
+        if indicator.name in names or needed & set(indicator.outputs):
+            out.append(indicator.name)
+            needed.update(indicator.inputs)
+    return out[::-1]
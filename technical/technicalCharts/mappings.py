@@ -1,52 +1,74 @@
+import Constant
+from indicators import mapping_properties
+
 index_mapping = {
     "settings": {
         "number_of_shards": 1,
         "number_of_replicas": 0,
         "refresh_interval": "1s"
     },
+    "mappings": {
+        # Candle and indicator fields come from the registry (see indicators.py)
+        "properties": mapping_properties("default")
+    }
+}
+
+# Query-optimized profile of the same documents. Every consumer filters by
+# ticker and/or date, so segments are sorted by (ticker, date) and a
+# ticker's candles sit together in date order. Prices and percentages are
+# scaled_float with 2 decimals in doc values (_source keeps the exact
+# values, which returnPct and customIndex read). Fields only ever read
+# back or aggregated are doc-values-only (not indexed); see
+# indicators.field_mapping.
+optimized_index_mapping = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "refresh_interval": "1s",
+        "index.codec": "best_compression",
+        "index.sort.field": ["ticker", "date"],
+        "index.sort.order": ["asc", "asc"]
+    },
+    "mappings": {
+        "properties": mapping_properties("optimized")
+    }
+}
+
+MAPPING_PROFILES = {"default": index_mapping, "optimized": optimized_index_mapping}
+
+
+def get_index_mapping(profile=None):
+    """
+    Mapping of the candle indices for `profile` (default:
+    Constant.mapping_profile). Only used when an index is created; existing
+    indices move to another profile with migrate_mapping.py.
+    """
+    return MAPPING_PROFILES[profile or Constant.mapping_profile]
+
+
+# Per-ticker state persisted by full and incremental runs (see index_state.py)
+state_mapping = {
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0
+    },
     "mappings": {
         "properties": {
-            # Core price fields
-            "date": {"type": "date"},
             "ticker": {"type": "keyword"},
-            "open": {"type": "float"},
-            "close": {"type": "float"},
-            "high": {"type": "float"},
-            "low": {"type": "float"},
-            "volume": {"type": "long"},
-            "indices": {"type": "keyword"},  # Array of index names
-
-            # Indicators
-            "rsi": {"type": "float"},
-            "roc": {"type": "float"},
-            "roc_nifty": {"type": "float"},
-            "atr": {"type": "float"},
-
-            # Moving Averages
-            "ma_10": {"type": "float"},
-            "ma_30": {"type": "float"},
-            "ma_40": {"type": "float"},
-
-            # Trend flags
-            "ma_10_above_30": {"type": "boolean"},
-            "ma_30_above_40": {"type": "boolean"},
-            "ma_10_above_40": {"type": "boolean"},
-
-            # Trend classification
-            "trend": {"type": "keyword"},
-
-            # 52 Week Metrics (weekly candles)
-            "high_52w": {"type": "float"},
-            "low_52w": {"type": "float"},
-            "dist_from_52w_high_pct": {"type": "float"},
-            "dist_from_52w_low_pct": {"type": "float"},
-
-            # VCP Template Filter
-            "vcp_trend_template": {"type": "boolean"},
-
-            # Metadata
-            "type": {"type": "keyword"},
-            "isCustom": {"type": "boolean"}
+            "last_date": {"type": "date"},
+
+            # Wilder RSI accumulators as of seed_date (the candle before last_date)
+            "seed_date": {"type": "date"},
+            "seed_close": {"type": "float", "index": False},
+            "rsi_avg_gain": {"type": "double", "index": False},
+            "rsi_avg_loss": {"type": "double", "index": False},
+
+            # streaming.IndicatorStream state as of seed_date, only read back whole
+            "stream": {"type": "object", "enabled": False},
+
+            # indicators.fingerprints the candle index was built with, on the
+            # index_state.VERSIONS_ID document
+            "indicators": {"type": "object", "enabled": False}
         }
     }
 }
@@ -0,0 +1,278 @@
+import functools
+import json
+import re
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+COUNTERS = ("calls", "seconds", "rows", "docs", "bytes", "took_ms")
+
+
+def _empty():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def _rates(stats):
+    stats = dict(stats, seconds=round(stats["seconds"], 6))
+    seconds = stats["seconds"]
+    stats["rows_per_sec"] = round(stats["rows"] / seconds) if seconds else None
+    stats["docs_per_sec"] = round(stats["docs"] / seconds) if seconds else None
+    return stats
+
+
+def rss_peak_bytes():
+    """
+    Peak resident set size of this process since it started or since the
+    last reset_rss_peak().
+    """
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(r"VmHWM:\s+(\d+) kB", f.read()).group(1)) * 1024
+    except (OSError, AttributeError):
+        # Lifetime peak only; in bytes on macOS, KiB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_rss_peak():
+    """
+    Starts a new peak for rss_peak_bytes() where the kernel allows it
+    (Linux); returns whether it did.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _size(value):
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+class Metrics:
+    """
+    Per-stage counters of the indexing pipeline: calls, wall seconds, rows,
+    docs, bytes sent and ES `took`, kept per (batch, timeframe, stage),
+    plus peaks (e.g. resident memory) kept as maxima per batch.
+
+    The batch and timeframe come from context() on the recording thread,
+    so each pipeline stage labels its own work. Worker processes return a
+    snapshot() that the caller merge()s under its own labels.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._peaks = {}
+        self.started = time.time()
+
+    # ---------- recording ---------- #
+
+    @contextmanager
+    def context(self, **labels):
+        """
+        Labels (batch=..., timeframe=...) for everything recorded on this
+        thread inside the block.
+        """
+        previous = self.labels()
+        self._local.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self._local.labels = previous
+
+    def labels(self):
+        return getattr(self._local, "labels", {})
+
+    def record(self, stage, seconds, labels=None, **counts):
+        labels = self.labels() if labels is None else labels
+        key = (labels.get("batch"), labels.get("timeframe"), stage)
+        with self._lock:
+            stats = self._stats.setdefault(key, _empty())
+            stats["calls"] += counts.pop("calls", 1)
+            stats["seconds"] += seconds
+            for name, value in counts.items():
+                stats[name] += value or 0
+
+    def peak(self, name, value, labels=None):
+        """
+        Records `value` of `name` (e.g. "rss_bytes"), keeping the maximum
+        per batch.
+        """
+        labels = self.labels() if labels is None else labels
+        key = (labels.get("batch"), name)
+        with self._lock:
+            self._peaks[key] = max(self._peaks.get(key, 0), value)
+
+    @contextmanager
+    def timed(self, stage, **counts):
+        """
+        Times the block; counts can be filled in through the yielded dict.
+        """
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.record(stage, time.perf_counter() - start, **counts)
+
+    def stage(self, name, count=None):
+        """
+        Decorator timing every call of a function as `name`.
+        count(result, *args) returns the counts of a call; by default rows
+        is the length of the first argument.
+        """
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                result = fn(*args, **kwargs)
+                elapsed = time.perf_counter() - start
+                counts = count(result, *args) if count else {"rows": _size(args[0]) if args else 0}
+                self.record(name, elapsed, **counts)
+                return result
+            return wrapper
+        return decorate
+
+    # ---------- worker processes ---------- #
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": [(key[2], dict(stats)) for key, stats in self._stats.items()],
+                "peaks": [(key[1], value) for key, value in self._peaks.items()]
+            }
+
+    def merge(self, snapshot):
+        """
+        Adds a worker's snapshot under the labels of the calling thread.
+        """
+        for stage, stats in snapshot["stages"]:
+            stats = dict(stats)
+            self.record(stage, stats.pop("seconds"), **stats)
+        for name, value in snapshot["peaks"]:
+            self.peak(name, value)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._peaks.clear()
+        self.started = time.time()
+
+    # ---------- reporting ---------- #
+
+    def summary(self):
+        """
+        {"run": {stage: stats}, "batches": {batch: {timeframe: {stage: stats}}},
+        "peaks": {"run": {name: max}, "batches": {batch: {name: max}}}}
+        where stats carry the counters plus rows_per_sec and docs_per_sec.
+        """
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+            peaks = dict(self._peaks)
+
+        run, batches = {}, {}
+        for (batch, timeframe, stage), stats in items:
+            name = stage if timeframe is None else f"{stage}/{timeframe}"
+            total = run.setdefault(name, _empty())
+            for counter in COUNTERS:
+                total[counter] += stats[counter]
+            if batch is not None:
+                batches.setdefault(str(batch), {}).setdefault(timeframe or "-", {})[stage] = _rates(stats)
+
+        run_peaks, batch_peaks = {}, {}
+        for (batch, name), value in peaks.items():
+            run_peaks[name] = max(run_peaks.get(name, 0), value)
+            if batch is not None:
+                batch_peaks.setdefault(str(batch), {})[name] = value
+
+        return {
+            "wall_seconds": round(time.time() - self.started, 3),
+            "run": {name: _rates(stats) for name, stats in sorted(run.items())},
+            "batches": batches,
+            "peaks": {"run": run_peaks, "batches": batch_peaks}
+        }
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def to_prometheus(self, prefix="indexing"):
+        """
+        Run totals in the Prometheus text exposition format.
+        """
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+
+        totals = {}
+        for (_, timeframe, stage), stats in items:
+            total = totals.setdefault((stage, timeframe or ""), _empty())
+            for counter in COUNTERS:
+                total[counter] += stats[counter]
+
+        lines = []
+        for counter in COUNTERS:
+            metric = f"{prefix}_stage_{counter}_total"
+            lines.append(f"# HELP {metric} {counter.replace('_', ' ')} per pipeline stage")
+            lines.append(f"# TYPE {metric} counter")
+            for (stage, timeframe), stats in sorted(totals.items()):
+                lines.append(f'{metric}{{stage="{stage}",timeframe="{timeframe}"}} {stats[counter]:g}')
+
+        for name, value in sorted(self.summary()["peaks"]["run"].items()):
+            metric = f"{prefix}_peak_{name}"
+            lines.append(f"# HELP {metric} highest {name.replace('_', ' ')} of the run")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self, batch=None, timeframe=None):
+        """
+        Logs one line per stage for the whole run, or for one batch
+        (optionally only its `timeframe` stages).
+        """
+        summary = self.summary()
+        if batch is None:
+            title, stages = "run", summary["run"]
+        else:
+            title = f"batch {batch}" if timeframe is None else f"batch {batch} {timeframe}"
+            stages = {
+                stage if tf == "-" or timeframe else f"{stage}/{tf}": stats
+                for tf, by_stage in summary["batches"].get(str(batch), {}).items()
+                if timeframe is None or tf == timeframe
+                for stage, stats in by_stage.items()
+            }
+
+        for name, stats in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+            logger.info(
+                f"metrics {title} {name}: {stats['seconds']:.3f}s in {stats['calls']} calls, "
+                f"{stats['rows']} rows, {stats['docs']} docs, {stats['bytes'] / 1024:.0f} KiB, "
+                f"took {stats['took_ms']} ms"
+            )
+
+
+# Process-wide registry
+METRICS = Metrics()
+
+
+def collect(fn, *args):
+    """
+    Runs fn(*args) in a worker process and returns (result, metrics
+    snapshot of that call), for METRICS.merge in the parent. The snapshot
+    carries the worker's peak RSS during the call as "worker_rss_bytes".
+    """
+    METRICS.reset()
+    reset_rss_peak()
+    result = fn(*args)
+    METRICS.peak("worker_rss_bytes", rss_peak_bytes())
+    return result, METRICS.snapshot()
@@ -0,0 +1,212 @@
+import argparse
+import json
+import statistics
+import time
+
+import Constant
+from bulk_load import bulk_load
+from elastic_client import get_es_client
+from logging_config import get_logger
+from mappings import MAPPING_PROFILES, get_index_mapping
+
+logger = get_logger(__name__)
+
+_POLL_SECONDS = 5
+
+
+def partitioned(name):
+    """
+    True when `name` is the read alias of a partitioned timeframe (see
+    partitions.py), which this tool does not migrate.
+    """
+    return any(
+        config["index_name"] == name and config.get("partition_years")
+        for config in Constant.timeframes.values()
+    )
+
+
+def concrete_index(es, name):
+    """
+    The index behind `name` (itself, or the index an alias points to).
+    """
+    indices = list(es.indices.get(index=name))
+    if len(indices) != 1:
+        raise ValueError(
+            f"{name} resolves to {indices}, expected one index; partitioned timeframes "
+            f"take their mapping from the partitions' index template (see partitions.py)"
+        )
+    return indices[0]
+
+
+def reindex(es, source, target, profile, forcemerge=None):
+    """
+    Creates `target` with the `profile` mapping and copies every document
+    of `source` into it (server-side _reindex, sliced per shard), on
+    bulk-load settings. Raises when documents failed or counts differ.
+    """
+    if es.indices.exists(index=target):
+        raise ValueError(f"{target} already exists")
+    es.indices.create(index=target, body=get_index_mapping(profile))
+
+    with bulk_load(target, es, forcemerge):
+        task = es.reindex(
+            source={"index": source}, dest={"index": target},
+            slices="auto", wait_for_completion=False
+        )["task"]
+        logger.info(f"Reindexing {source} -> {target} (task {task})")
+
+        while True:
+            resp = es.tasks.get(task_id=task)
+            status = resp["task"]["status"]
+            logger.info(f"reindex: {status.get('created', 0) + status.get('updated', 0)}/{status.get('total')} docs")
+            if resp.get("completed"):
+                break
+            time.sleep(_POLL_SECONDS)
+
+    failures = resp.get("response", {}).get("failures") or resp.get("error")
+    if failures:
+        raise RuntimeError(f"Reindex {source} -> {target} failed: {failures}")
+
+    before = es.count(index=source)["count"]
+    after = es.count(index=target)["count"]
+    if before != after:
+        raise RuntimeError(f"Reindex {source} -> {target} copied {after} of {before} documents")
+    logger.info(f"Reindexed {after} documents into {target}")
+
+
+def swap(es, name, target):
+    """
+    Points `name` at `target` in one atomic alias update. A concrete index
+    called `name` is deleted (it was copied into `target`); when `name` is
+    already an alias, its old index is only detached and kept.
+    """
+    if es.indices.exists_alias(name=name):
+        old = concrete_index(es, name)
+        actions = [{"remove": {"index": old, "alias": name}}]
+    else:
+        actions = [{"remove_index": {"index": name}}]
+    es.indices.update_aliases(actions=actions + [{"add": {"index": target, "alias": name}}])
+    logger.info(f"{name} now points to {target}")
+
+
+# ================= REPORT ================= #
+
+def index_stats(es, index):
+    stats = es.indices.stats(index=index, metric=["docs", "store", "segments"])["indices"][index]["primaries"]
+    return {
+        "docs": stats["docs"]["count"],
+        "store_bytes": stats["store"]["size_in_bytes"],
+        "segments": stats["segments"]["count"]
+    }
+
+
+def sample_queries(es, index):
+    """
+    The query shapes the consumers run, on the latest stock candle:
+    returnPct's snapshot of one date, customIndex's full history of a
+    ticker sorted by date, and a one-year range of a ticker.
+    """
+    latest = es.search(
+        index=index, size=1, sort=[{"date": "desc"}],
+        query={"term": {"type": "stock"}}, source=["ticker", "date"]
+    )["hits"]["hits"][0]["_source"]
+    ticker, date = latest["ticker"], latest["date"][:10]
+
+    return {
+        "date_snapshot": {
+            "query": {"bool": {"filter": [{"term": {"date": date}}, {"term": {"type": "stock"}}]}},
+            "size": 10000
+        },
+        "ticker_history": {
+            "query": {"bool": {"filter": [{"terms": {"ticker": [ticker]}}]}},
+            "sort": [{"date": {"order": "asc"}}],
+            "size": 10000
+        },
+        "ticker_year": {
+            "query": {"bool": {"filter": [
+                {"term": {"ticker": ticker}},
+                {"range": {"date": {"gte": f"{date}||-1y", "lte": date}}}
+            ]}},
+            "sort": [{"date": {"order": "asc"}}],
+            "size": 10000
+        }
+    }
+
+
+def measure(es, index, queries, repeats):
+    """
+    Median ES `took` and client wall time (ms) of each query over
+    `repeats` runs, after one warm-up, with the request cache off.
+    """
+    out = {}
+    for name, body in queries.items():
+        took, wall = [], []
+        for i in range(repeats + 1):
+            start = time.perf_counter()
+            resp = es.search(index=index, request_cache=False, **body)
+            if i:
+                wall.append((time.perf_counter() - start) * 1000)
+                took.append(resp["took"])
+        out[name] = {
+            "hits": len(resp["hits"]["hits"]),
+            "took_ms": statistics.median(took),
+            "wall_ms": round(statistics.median(wall), 2)
+        }
+    return out
+
+
+def report(es, before, after, repeats):
+    queries = sample_queries(es, before)
+    result = {}
+    for label, index in (("before", before), ("after", after)):
+        result[label] = {"index": index, **index_stats(es, index), "queries": measure(es, index, queries, repeats)}
+
+    b, a = result["before"], result["after"]
+    print(f"{'':<16}{b['index']:>28}{a['index']:>28}")
+    print(f"{'docs':<16}{b['docs']:>28}{a['docs']:>28}")
+    print(f"{'store MiB':<16}{b['store_bytes'] / 1024 ** 2:>28.1f}{a['store_bytes'] / 1024 ** 2:>28.1f}")
+    print(f"{'segments':<16}{b['segments']:>28}{a['segments']:>28}")
+    for name in queries:
+        print(f"{name + ' ms':<16}{b['queries'][name]['wall_ms']:>28}{a['queries'][name]['wall_ms']:>28}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a candle index to another mapping profile")
+    parser.add_argument("index", nargs="?", default=Constant.index_name, help="index (or alias) to migrate")
+    parser.add_argument("--profile", choices=list(MAPPING_PROFILES), default="optimized")
+    parser.add_argument("--target", help="new index name (default: <index>_<profile>)")
+    parser.add_argument("--swap", action="store_true",
+                        help="after the copy, replace the index by an alias of the same name on the new one")
+    parser.add_argument("--forcemerge", action="store_true", default=Constant.bulk_load_forcemerge,
+                        help="force-merge the new index after the copy")
+    parser.add_argument("--repeats", type=int, default=20, help="runs per query in the latency report")
+    parser.add_argument("--report", help="also write the before/after report to this JSON file")
+    parser.add_argument("--report-only", metavar="OTHER",
+                        help="skip the migration and compare the index with OTHER")
+    args = parser.parse_args()
+    if partitioned(args.index):
+        parser.error(
+            f"{args.index} is partitioned; new partitions take the mapping of Constant.mapping_profile "
+            f"from their index template (see partitions.py), existing ones are not migrated"
+        )
+
+    es = get_es_client()
+    source = concrete_index(es, args.index)
+
+    if args.report_only:
+        target = args.report_only
+    else:
+        target = args.target or f"{source}_{args.profile}"
+        reindex(es, source, target, args.profile, args.forcemerge)
+
+    result = report(es, source, target, args.repeats)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.swap and not args.report_only:
+        swap(es, args.index, target)
+
+if __name__ == "__main__":
+    main()
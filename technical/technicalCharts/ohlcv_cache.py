@@ -0,0 +1,120 @@
+import json
+import os
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+import pandas as pd
+
+import Constant
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+# ================= FILES ================= #
+
+def _path(ticker):
+    # Percent-encode so "^NSEI" or "M&M.NS" make safe, collision-free file names
+    return os.path.join(Constant.cache_dir, f"{quote(ticker, safe='')}.parquet")
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def load(ticker):
+    """
+    Cached daily OHLCV for a ticker ([Date, Open, High, Low, Close, Volume]) or None.
+    """
+    path = _path(ticker)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def save(ticker, frame):
+    os.makedirs(Constant.cache_dir, exist_ok=True)
+    _atomic_write(_path(ticker), lambda tmp: frame.to_parquet(tmp, index=False))
+
+
+# ================= MANIFEST ================= #
+
+def load_manifest():
+    """
+    {ticker: {"start": first requested date, "fetched_at": ISO timestamp}}
+    """
+    path = os.path.join(Constant.cache_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    os.makedirs(Constant.cache_dir, exist_ok=True)
+
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    _atomic_write(os.path.join(Constant.cache_dir, MANIFEST), write)
+
+
+def mark_fetched(manifest, ticker, start_date=None):
+    entry = manifest.setdefault(ticker, {})
+    if start_date is not None:
+        entry["start"] = start_date
+    entry["fetched_at"] = datetime.now().isoformat(timespec="seconds")
+
+
+def covers(entry, start_date):
+    """
+    True when the cached history was fetched from `start_date` or earlier.
+    """
+    return entry is not None and "start" in entry and entry["start"] <= start_date
+
+
+def is_fresh(entry):
+    """
+    True when the ticker was fetched within Constant.cache_ttl_hours, so a
+    rerun (e.g. after a crash) does not hit the provider again.
+    """
+    fetched_at = datetime.fromisoformat(entry["fetched_at"])
+    return datetime.now() - fetched_at < timedelta(hours=Constant.cache_ttl_hours)
+
+
+# ================= DELTA MERGE ================= #
+
+def delta_start(cached):
+    """
+    Date to re-download from: the second-to-last cached bar, so that one
+    complete bar overlaps (the last one may have been cached mid-session).
+    """
+    dates = cached["Date"]
+    return dates.iloc[-2] if len(dates) >= 2 else dates.iloc[-1]
+
+
+def merge(cached, fresh):
+    """
+    Appends freshly downloaded bars to the cached ones; fresh bars win on
+    overlapping dates. Returns None when the overlapping complete bar no
+    longer matches, i.e. the provider re-adjusted history (split/dividend)
+    and the ticker must be fetched in full again.
+    """
+    if fresh is None or fresh.empty:
+        return cached
+
+    check_date = delta_start(cached)
+    old = cached.loc[cached["Date"] == check_date, "Close"]
+    new = fresh.loc[fresh["Date"] == check_date, "Close"]
+    if not old.empty and not new.empty:
+        old_close, new_close = float(old.iloc[0]), float(new.iloc[0])
+        if abs(new_close - old_close) > Constant.cache_adjust_tolerance * abs(old_close):
+            return None
+
+    kept = cached[cached["Date"] < fresh["Date"].min()]
+    return pd.concat([kept, fresh], ignore_index=True).sort_values("Date", ignore_index=True)
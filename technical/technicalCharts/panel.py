@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks import benchmark_columns
+from index_state import history_stream, state_from_arrays
+from indicators import INDICATORS, MA_PERIODS
+from indexer import downcast_indicators, fill0, rsi_kernel, screen_kernel, trend_column
+from metrics import METRICS
+from serializer import serialize_columns
+from timeframes import WEEKLY
+
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+DEFAULT_METADATA = {"indices": [], "type": "stock", "isCustom": False}
+
+
+# ================= PANELS ================= #
+
+def _column(data_df, ticker, field):
+    # Multi-ticker downloads are flattened to "TICKER/Field", single ones to "Field/TICKER"
+    for name in (f"{ticker}/{field}", f"{field}/{ticker}"):
+        if name in data_df.columns:
+            return name
+    return None
+
+
+def select_tickers(data_df, tickers):
+    """
+    Date plus the OHLCV columns of `tickers`, e.g. to ship a sub-panel to a worker.
+    """
+    columns = [_column(data_df, t, f) for t in tickers for f in FIELDS]
+    return data_df[["Date"] + [c for c in columns if c is not None]]
+
+
+def split_panels(data_df, tickers):
+    """
+    Splits a wide batch frame from fetch_data into one (dates x tickers)
+    frame per OHLCV field, sorted by date.
+    Columns are matched by exact name, never by ticker prefix. float32
+    prices (data_fetcher.downcast_prices) stay float32.
+    Returns (dates, tickers present, {field: DataFrame}).
+    """
+    present = [t for t in tickers if all(_column(data_df, t, f) for f in FIELDS)]
+
+    data_df = data_df.assign(Date=pd.to_datetime(data_df["Date"], errors="coerce"))
+    data_df = data_df.sort_values("Date", kind="stable")
+    dates = pd.DatetimeIndex(data_df["Date"])
+
+    panels = {}
+    for field in FIELDS:
+        values = data_df[[_column(data_df, t, field) for t in present]].to_numpy()
+        if values.dtype != np.float32:
+            values = values.astype(np.float64, copy=False)
+        panels[field] = pd.DataFrame(values, columns=present)
+    return dates, present, panels
+
+
+# ================= INDICATORS ================= #
+
+def _cells(result, values, *args):
+    # Metrics rows of a panel step: candles of every ticker
+    return {"rows": values.size}
+
+
+@METRICS.stage("panel_rsi", count=_cells)
+def panel_rsi(close, period):
+    """
+    Wilder RSI per column; NaN closes are skipped per ticker as in calculate_rsi.
+    Returns (rsi, avg_gain, avg_loss) arrays shaped like `close`.
+    """
+    close = close.to_numpy(dtype=np.float64)
+    out = [np.full(close.shape, np.nan) for _ in range(3)]
+    for j in range(close.shape[1]):
+        valid = ~np.isnan(close[:, j])
+        for arr, values in zip(out, rsi_kernel(close[valid, j], period)):
+            arr[valid, j] = values
+    return out
+
+
+@METRICS.stage("panel_atr", count=_cells)
+def panel_atr(high, low, close, period):
+    prev_close = close.shift()
+    # fmax skips NaN like DataFrame.max(axis=1) does in calculate_atr
+    tr = np.fmax(np.fmax(high - low, (high - prev_close).abs()), (low - prev_close).abs())
+    return tr.rolling(period).mean().fillna(0.0)
+
+
+@METRICS.stage("panel_roc", count=_cells)
+def panel_roc(close, period):
+    return (close.pct_change(periods=period, fill_method=None) * 100).fillna(0.0)
+
+
+@METRICS.stage("panel_ma", count=_cells)
+def panel_ma(close, ma_period, ma_type="sma"):
+    if ma_type == "sma":
+        ma = close.rolling(ma_period).mean()
+    elif ma_type == "ema":
+        ma = close.ewm(span=ma_period, adjust=False).mean()
+    else:
+        raise ValueError("ma_type must be sma or ema")
+    return ma.fillna(0.0)
+
+
+def _panel_rsi(dates, panels, out, benchmarks, tf):
+    rsi, avg_gain, avg_loss = panel_rsi(panels["Close"], tf.rsi_window)
+    return {"rsi": fill0(rsi), "rsi_avg_gain": avg_gain, "rsi_avg_loss": avg_loss}
+
+
+def _panel_ma(dates, panels, out, benchmarks, tf):
+    return {f"ma_{p}": panel_ma(panels["Close"], p).to_numpy() for p in MA_PERIODS}
+
+
+def _panel_screens(dates, panels, out, benchmarks, tf):
+    # MA flags, trend, 52 week metrics over the timeframe's window, VCP
+    with METRICS.timed("panel_screens", rows=panels["Close"].size):
+        return screen_kernel(
+            panels["Close"].to_numpy(), panels["High"].to_numpy(), panels["Low"].to_numpy(),
+            out["ma_10"], out["ma_30"], out["ma_40"], tf.high_low_window
+        )
+
+
+# Panel computation of every indicator of indicators.INDICATORS, by name:
+# step(dates, panels, out so far, benchmarks, timeframe) -> {column: array}
+PANEL_STEPS = {
+    "rsi": _panel_rsi,
+    "roc": lambda dates, panels, out, benchmarks, tf: {"roc": panel_roc(panels["Close"], tf.roc_period).to_numpy()},
+    "benchmark_roc": lambda dates, panels, out, benchmarks, tf: benchmark_columns(benchmarks, dates),
+    "atr": lambda dates, panels, out, benchmarks, tf: {
+        "atr": panel_atr(panels["High"], panels["Low"], panels["Close"], tf.atr_period).to_numpy()
+    },
+    "ma": _panel_ma,
+    "screens": _panel_screens,
+}
+
+
+@METRICS.stage("compute_panel", count=lambda result, dates, panels, *args: {"rows": panels["Close"].size})
+def compute_panel(dates, panels, benchmarks=(), timeframe=WEEKLY):
+    """
+    Every indicator of compute_indicators for all tickers of a batch at
+    once. Returns {frame column: 2-D array (dates x tickers)}, with the same
+    defaults filled in; benchmark ROC columns are 1-D, shared by all tickers,
+    and the trend holds int8 codes (see indexer.trend_column). Like
+    compute_indicators, float32 prices give float32 indicators.
+    """
+    out = {}
+    for indicator in INDICATORS:
+        out.update(PANEL_STEPS[indicator.name](dates, panels, out, benchmarks, timeframe))
+
+    for field in FIELDS:
+        out[field] = fill0(panels[field].to_numpy())
+    if panels["Close"].dtypes.iloc[0] == np.float32:
+        downcast_indicators(out)
+    return out
+
+
+# ================= DOCUMENTS ================= #
+
+def prepare_panel(data_df, tickers, benchmarks=(), metadata=None, timeframe=WEEKLY):
+    """
+    Panel counterpart of indexer.prepare_ticker for a whole fetched batch.
+    `metadata` maps ticker -> {"indices", "type", "isCustom"}.
+    Returns [(ticker, [(doc_id, encoded _source)], state)].
+    """
+    metadata = metadata or {}
+    dates, tickers, panels = split_panels(data_df, tickers)
+    if not tickers:
+        return []
+
+    out = compute_panel(dates, panels, benchmarks, timeframe)
+    day_strings = dates.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    date_values = dates.to_numpy()
+
+    # Streams replay the prices with their NaNs, before the defaults
+    prices = {field: panels[field].to_numpy() for field in ("High", "Low", "Close")}
+
+    results = []
+    for j, ticker in enumerate(tickers):
+        columns = {name: (arr if arr.ndim == 1 else arr[:, j]) for name, arr in out.items()}
+        columns["trend"] = trend_column(columns["trend"])
+        docs = serialize_columns(ticker, day_strings, columns, metadata.get(ticker, DEFAULT_METADATA))
+        stream = history_stream(
+            timeframe, prices["High"][:, j], prices["Low"][:, j], prices["Close"][:, j],
+            columns["rsi_avg_gain"], columns["rsi_avg_loss"]
+        )
+        state = state_from_arrays(
+            ticker, date_values, columns["Close"], columns["rsi_avg_gain"], columns["rsi_avg_loss"], stream=stream
+        )
+        results.append((ticker, docs, state))
+    return results
@@ -0,0 +1,252 @@
+"""
+Time-partitioned candle indices.
+
+A timeframe with `partition_years` (see Constant.timeframes) writes each
+candle to the partition of its date, e.g. nifty_data_weekly-2024, and is
+read through an alias named like the unpartitioned index, so consumers
+keep querying nifty_data_weekly. Partitions share an index template with
+the candle mapping.
+
+Run from this directory:
+    python partitions.py migrate weekly    # split the existing single index
+    python partitions.py seal daily weekly # read-only + force-merge past partitions
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import Constant
+from elastic_client import ensure_index, get_es_client
+from logging_config import get_logger
+from mappings import get_index_mapping
+from timeframes import get_timeframe
+
+logger = get_logger(__name__)
+
+_ensured = set()
+
+
+def partition_start(year, years):
+    return year - year % years
+
+
+def partition_index(index_name, date, years):
+    """
+    Partition of `index_name` holding the candle of `date` ("YYYY-MM-DD"),
+    named after the first year it covers.
+    """
+    return f"{index_name}-{partition_start(int(date[:4]), years)}"
+
+
+def partition_names(index_name, years, start=None, end=None):
+    """
+    Partitions covering start..end (default: Constant.startDate to today).
+    """
+    first = pd.Timestamp(start or Constant.startDate).year
+    last = pd.Timestamp(end or datetime.now()).year
+    return [f"{index_name}-{year}" for year in range(partition_start(first, years), last + 1, years)]
+
+
+def _pattern(index_name):
+    return f"{index_name}-*"
+
+
+def _is_partition(index_name, name):
+    prefix = f"{index_name}-"
+    return name.startswith(prefix) and name[len(prefix):].isdigit()
+
+
+def _alias_targets(es, index_name):
+    """
+    Concrete indices behind the alias `index_name`; None when it is no alias.
+    """
+    if not es.indices.exists_alias(name=index_name):
+        return None
+    return sorted(es.indices.get_alias(name=index_name))
+
+
+def _put_template(es, index_name, alias=True):
+    """
+    Index template of the partitions. With `alias`, a partition created by
+    a write (the first candle of a new year) joins the read alias at once.
+    """
+    mapping = get_index_mapping()
+    template = {"settings": mapping["settings"], "mappings": mapping["mappings"]}
+    if alias:
+        template["aliases"] = {index_name: {}}
+    es.indices.put_index_template(
+        name=f"{index_name}-partitions", index_patterns=[_pattern(index_name)], template=template
+    )
+
+
+def ensure_partitions(index_name, years, es=None, alias=True):
+    """
+    Puts the partitions' index template, creates the partitions up to the
+    current one and adds them to the read alias `index_name`. Runs once
+    per index and process. Raises when `index_name` is a concrete index, or
+    an alias over anything but its partitions (e.g. after
+    `migrate_mapping.py --swap`), instead of serving candles twice (see
+    `migrate`).
+    """
+    if (index_name, alias) in _ensured:
+        return
+    es = es or get_es_client()
+
+    if alias and es.indices.exists(index=index_name):
+        targets = _alias_targets(es, index_name)
+        if targets is None:
+            raise RuntimeError(
+                f"{index_name} is an index, not an alias over its partitions; "
+                f"run `python partitions.py migrate` for its timeframe first"
+            )
+        others = [name for name in targets if not _is_partition(index_name, name)]
+        if others:
+            raise RuntimeError(
+                f"{index_name} is an alias over {others}, not over its partitions; "
+                f"run `python partitions.py migrate` for its timeframe first"
+            )
+
+    _put_template(es, index_name, alias)
+    for name in partition_names(index_name, years):
+        # 400 = exists already
+        es.options(ignore_status=400).indices.create(index=name)
+    if alias:
+        es.indices.update_aliases(actions=[{"add": {"index": _pattern(index_name), "alias": index_name}}])
+    _ensured.add((index_name, alias))
+
+
+def ensure_candle_index(index_name, es=None, years=None):
+    """
+    ensure_index with the candle mapping, or ensure_partitions when the
+    index is partitioned every `years` years.
+    """
+    if years:
+        ensure_partitions(index_name, years, es)
+    else:
+        ensure_index(index_name, get_index_mapping(), es)
+
+
+def unseal_partitions(index_name, es=None):
+    """
+    Lifts the write block of sealed partitions, before a full rebuild.
+    Returns the partitions it unsealed, for `reseal_partitions`.
+    """
+    es = es or get_es_client()
+    resp = es.indices.get_settings(index=_pattern(index_name), name="index.blocks.write", flat_settings=True)
+    sealed = sorted(
+        name for name, body in resp.items()
+        if str(body.get("settings", {}).get("index.blocks.write")).lower() == "true"
+    )
+    if sealed:
+        es.indices.put_settings(index=",".join(sealed), settings={"index.blocks.write": None})
+        logger.info(f"Unsealed {len(sealed)} partitions of {index_name} for the rebuild")
+    return sealed
+
+
+def reseal_partitions(names, es=None):
+    """
+    Seals the partitions `unseal_partitions` returned again, once the
+    rebuild is done.
+    """
+    es = es or get_es_client()
+    for name in names:
+        _seal(es, name)
+
+
+def _seal(es, name):
+    es.indices.put_settings(index=name, settings={"index.blocks.write": True})
+    logger.info(f"Sealed {name}, force-merging")
+    es.options(request_timeout=Constant.bulk_load_forcemerge_timeout).indices.forcemerge(
+        index=name, max_num_segments=1
+    )
+
+
+def seal_partitions(index_name, years, es=None):
+    """
+    Makes the partitions that ended more than Constant.partition_seal_after_days
+    ago read-only and force-merges them to one segment each.
+    """
+    es = es or get_es_client()
+    cutoff = (datetime.now() - timedelta(days=Constant.partition_seal_after_days)).year
+    for name in partition_names(index_name, years):
+        end_year = int(name.rsplit("-", 1)[1]) + years - 1
+        if end_year >= cutoff or not es.indices.exists(index=name):
+            continue
+        _seal(es, name)
+
+
+def migrate(index_name, years, es=None):
+    """
+    Splits the single index `index_name` into its partitions (server-side
+    _reindex routing each document by its date), then replaces the index
+    by the read alias in one atomic alias update. `index_name` may also be
+    an alias over one index (e.g. after `migrate_mapping.py --swap`): the
+    alias then moves to the partitions and that index is deleted.
+    """
+    es = es or get_es_client()
+    targets = _alias_targets(es, index_name)
+    if targets is not None:
+        sources = [name for name in targets if not _is_partition(index_name, name)]
+        if not sources:
+            logger.info(f"{index_name} is already an alias over its partitions")
+            return
+        if len(sources) != len(targets) or len(sources) > 1:
+            raise RuntimeError(f"{index_name} is an alias over {targets}, expected one index to partition")
+    ensure_partitions(index_name, years, es, alias=False)
+
+    resp = es.options(request_timeout=Constant.bulk_load_forcemerge_timeout).reindex(
+        source={"index": index_name},
+        dest={"index": f"{index_name}-unrouted"},
+        script={
+            "lang": "painless",
+            "source": "int y = Integer.parseInt(ctx._source.date.substring(0, 4));"
+                      "ctx._index = params.prefix + (y - y % params.years);",
+            "params": {"prefix": f"{index_name}-", "years": years}
+        },
+        slices="auto", wait_for_completion=True
+    )
+    if resp.get("failures"):
+        raise RuntimeError(f"Partitioning {index_name} failed: {resp['failures']}")
+
+    es.indices.refresh(index=_pattern(index_name))
+    before = es.count(index=index_name)["count"]
+    after = es.count(index=_pattern(index_name))["count"]
+    if before != after:
+        raise RuntimeError(f"Partitioning {index_name} copied {after} of {before} documents")
+
+    if targets is None:
+        es.indices.update_aliases(actions=[
+            {"remove_index": {"index": index_name}},
+            {"add": {"index": _pattern(index_name), "alias": index_name}}
+        ])
+    else:
+        es.indices.update_aliases(actions=[
+            {"remove": {"index": sources[0], "alias": index_name}},
+            {"add": {"index": _pattern(index_name), "alias": index_name}}
+        ])
+        es.indices.delete(index=sources[0])
+    # The alias name is free now; new partitions join it from the template
+    _put_template(es, index_name)
+    logger.info(f"{index_name} is now an alias over {after} documents in {len(partition_names(index_name, years))} partitions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the time-partitioned candle indices")
+    parser.add_argument("command", choices=["migrate", "seal"])
+    parser.add_argument("timeframes", nargs="+", choices=list(Constant.timeframes))
+    args = parser.parse_args()
+
+    es = get_es_client()
+    for name in args.timeframes:
+        tf = get_timeframe(name)
+        if not tf.partition_years:
+            logger.warning(f"{name} is not partitioned (no partition_years in Constant.timeframes)")
+            continue
+        if args.command == "migrate":
+            migrate(tf.index_name, tf.partition_years, es)
+        else:
+            seal_partitions(tf.index_name, tf.partition_years, es)
+
+if __name__ == "__main__":
+    main()
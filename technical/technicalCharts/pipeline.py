@@ -0,0 +1,73 @@
+import queue
+import threading
+
+# End of a stage's output
+DONE = object()
+# End of one job's items (see full_indexing._index_stage)
+END = object()
+
+_POLL_SECONDS = 0.1
+
+
+class PipelineStopped(Exception):
+    """
+    Raised in a stage when another stage failed, so it stops waiting.
+    """
+
+
+def put(q, item, stop):
+    """
+    Blocking put on a bounded queue (backpressure), giving up once `stop`
+    is set so a producer never hangs on a consumer that died.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+    raise PipelineStopped()
+
+
+def get(q, stop):
+    """
+    Blocking get, giving up once `stop` is set.
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    raise PipelineStopped()
+
+
+class Stage(threading.Thread):
+    """
+    Runs target(*args) in a thread. An exception sets `stop`, which makes
+    every other stage give up, and is kept for raise_errors().
+    """
+
+    def __init__(self, name, target, args, stop):
+        super().__init__(name=name, daemon=True)
+        self._stage_target = target
+        self._stage_args = args
+        self.stop = stop
+        self.error = None
+
+    def run(self):
+        try:
+            self._stage_target(*self._stage_args)
+        except PipelineStopped:
+            pass
+        except BaseException as e:
+            self.error = e
+            self.stop.set()
+
+
+def raise_errors(*stages):
+    """
+    Re-raises the first error of the given (joined) stages.
+    """
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
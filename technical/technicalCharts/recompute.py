@@ -0,0 +1,139 @@
+"""
+Rewrites the fields of indicators that changed since a candle index was built.
+
+Full runs record the indicator fingerprints (version and parameters, see
+indicators.fingerprints) in the timeframe's state index. This tool compares
+them with the current registry, recomputes the changed indicators (plus
+the indicators they read and the ones reading them) over each ticker's
+full history and sends partial updates of only their fields; every other
+field of the documents stays as it is. The states are rebuilt as well,
+since their indicator stream carries the fingerprints.
+
+Run from this directory:
+    python recompute.py weekly          # what changed, then rewrite it
+    python recompute.py daily --dry-run # only show what would be rewritten
+"""
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import Constant
+from benchmarks import fetch_benchmarks, prepare_benchmarks
+from bulk_sink import BulkSink
+from data_fetcher import fetch_data, resample, to_long
+from elastic_client import get_es_client
+from full_indexing import get_universe, iter_ticker_frames
+from index_state import build_state, load_states, load_versions, save_states, save_versions
+from indexer import compute_indicators
+from indicators import changed_indicators, fingerprints, get_indicator, mapping_properties, required_indicators
+from logging_config import get_logger
+from mappings import MAPPING_PROFILES
+from serializer import serialize_documents, update_actions
+from timeframes import get_timeframe
+
+logger = get_logger(__name__)
+
+
+def plan(es, timeframe):
+    """
+    (indicators whose fields are rewritten, indicators to compute for
+    them) on `timeframe`; both empty when the index is up to date.
+    """
+    write = changed_indicators(load_versions(es, timeframe.state_index_name), fingerprints(timeframe))
+    # RSI feeds the rebuilt states even when its own fields are current
+    compute = required_indicators(write + ["rsi"]) if write else []
+    return write, compute
+
+
+def recompute_ticker(data, ticker, state, benchmarks, timeframe, write, compute):
+    """
+    ([(doc_id, encoded partial _source)], new state) of one ticker: the
+    fields of `write` for its candles up to the state's last_date (the
+    candles its documents exist for).
+    """
+    computed = compute_indicators(data, benchmarks, timeframe=timeframe, names=compute)
+    computed = computed[computed["Date"] <= pd.Timestamp(state["last_date"])]
+    fields = {field.name for name in write for field in get_indicator(name).fields}
+    docs = serialize_documents(computed, ticker, fields=fields)
+    prices = data.loc[computed.index, ["High", "Low", "Close"]]
+    new_state = build_state(ticker, computed, state, prices=prices, timeframe=timeframe)
+    return docs, new_state
+
+
+def recompute(timeframe, tickers=None, profile=None, dry_run=False):
+    """
+    Brings the candle index of `timeframe` to the current indicator
+    versions. Only a run over the whole universe records them, like
+    full_indexing.full_index.
+    """
+    es = get_es_client()
+    write, compute = plan(es, timeframe)
+    if not write:
+        logger.info(f"{timeframe.index_name}: indicators are up to date")
+        return
+    fields = [field for name in write for field in get_indicator(name).fields]
+    logger.info(
+        f"{timeframe.index_name}: rewriting {', '.join(write)} ({len(fields)} fields), "
+        f"computing {', '.join(compute)}"
+    )
+    if dry_run:
+        return
+
+    profile = profile or Constant.mapping_profile
+    # New fields get their mapping before the first update; on a partitioned
+    # timeframe this reaches every partition behind the alias, and the next
+    # indexing run puts the template from the registry
+    es.indices.put_mapping(index=timeframe.index_name, properties=mapping_properties(profile, fields))
+
+    whole_universe = tickers is None
+    if whole_universe:
+        tickers, _, _ = get_universe()
+    benchmarks = ()
+    if "benchmark_roc" in compute:
+        benchmarks = prepare_benchmarks(fetch_benchmarks(), timeframe)
+
+    end_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    sink = BulkSink(es)
+    try:
+        for start in range(0, len(tickers), Constant.batch_size):
+            batch = tickers[start:start + Constant.batch_size]
+            states = load_states(es, timeframe.state_index_name, batch)
+            daily = fetch_data(batch, Constant.startDate, end_date, to_weekly=False)
+            if daily is None:
+                logger.warning(f"No data for {batch}, skipped")
+                continue
+
+            new_states = []
+            for ticker, data in iter_ticker_frames(to_long(resample(daily, timeframe.anchor), batch)):
+                if ticker not in states:
+                    # Never indexed: the next full run writes it whole
+                    continue
+                docs, state = recompute_ticker(data, ticker, states[ticker], benchmarks, timeframe, write, compute)
+                sink.send(update_actions(timeframe.index_name, docs, timeframe.partition_years))
+                new_states.append(state)
+            save_states(es, timeframe.state_index_name, new_states)
+            logger.info(f"Recomputed {len(new_states)} of {len(batch)} tickers ({start + len(batch)}/{len(tickers)})")
+
+        if whole_universe:
+            save_versions(es, timeframe.state_index_name, fingerprints(timeframe))
+    finally:
+        sink.log_summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite the fields of indicators that changed")
+    parser.add_argument("timeframes", nargs="*", choices=list(Constant.timeframes),
+                        default=Constant.full_index_timeframes)
+    parser.add_argument("--tickers", nargs="+", help="only these tickers (versions are then not recorded)")
+    parser.add_argument("--profile", choices=list(MAPPING_PROFILES),
+                        help="mapping profile of the index (default: Constant.mapping_profile)")
+    parser.add_argument("--dry-run", action="store_true", help="only log what would be rewritten")
+    args = parser.parse_args()
+
+    for name in args.timeframes:
+        recompute(get_timeframe(name), args.tickers, args.profile, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+from contextlib import ExitStack
+
+import Constant
+from bulk_load import bulk_load
+from bulk_sink import BulkSink
+from elastic_client import ensure_index
+from file_sink import file_indices, list_files, read_actions
+from logging_config import get_logger
+from mappings import get_index_mapping, state_mapping
+from metrics import METRICS
+from partitions import ensure_partitions
+
+logger = get_logger(__name__)
+
+
+def mapping_for(index_name):
+    """
+    Mapping to create `index_name` with: state indices of the configured
+    timeframes get state_mapping, everything else the candle mapping.
+    """
+    state_indices = {config["state_index_name"] for config in Constant.timeframes.values()}
+    return state_mapping if index_name in state_indices else get_index_mapping()
+
+
+def ensure_target(index_name, es):
+    """
+    Creates `index_name` the way an indexing run would: a partition of a
+    partitioned timeframe through partitions.ensure_partitions (template
+    and read alias), anything else with mapping_for.
+    """
+    base, _, year = index_name.rpartition("-")
+    for config in Constant.timeframes.values():
+        if config.get("partition_years") and base == config["index_name"] and year.isdigit():
+            ensure_partitions(base, config["partition_years"], es)
+            return
+    ensure_index(index_name, mapping_for(index_name), es)
+
+
+def replay(directory, sink=None, bulk_load_mode=False, forcemerge=None):
+    """
+    Streams every file a file_sink.FileSink wrote under `directory` into
+    Elasticsearch, in the order they were written, creating the indices
+    first. Documents keep their ids, so replaying again is harmless.
+    Returns the number of documents written.
+    """
+    files = list_files(directory)
+    if not files:
+        logger.warning(f"No bulk files under {directory}")
+        return 0
+
+    sink = sink or BulkSink()
+    indices = sorted({index for path in files for index in file_indices(path)})
+    for index in indices:
+        ensure_target(index, sink.es)
+    logger.info(f"Replaying {len(files)} files from {directory} into {', '.join(indices)}")
+
+    total = 0
+    try:
+        with ExitStack() as load_settings:
+            if bulk_load_mode:
+                for index in indices:
+                    load_settings.enter_context(bulk_load(index, sink.es, forcemerge))
+
+            for number, path in enumerate(files, start=1):
+                with METRICS.context(batch=number):
+                    written = sink.send(read_actions(path))
+                total += written
+                logger.info(f"Replayed {path} ({number}/{len(files)}): {written} docs")
+    finally:
+        sink.log_summary()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the bulk files of an offline run into Elasticsearch")
+    parser.add_argument("directory", nargs="?", default=Constant.bulk_file_dir,
+                        help="directory written by fullIndexing.py --output-dir")
+    parser.add_argument("--bulk-threads", type=int, default=Constant.bulk_thread_count,
+                        help="threads sending bulk chunks in parallel (1 = streaming_bulk)")
+    parser.add_argument("--bulk-chunk-docs", type=int, default=Constant.bulk_chunk_size,
+                        help="max documents per bulk chunk")
+    parser.add_argument("--bulk-chunk-mb", type=float, default=Constant.bulk_max_chunk_bytes / 1024 ** 2,
+                        help="max size of a bulk chunk in MiB")
+    parser.add_argument("--no-bulk-load", dest="bulk_load", action="store_false", default=Constant.bulk_load,
+                        help="keep the live index settings (refresh, translog, replicas) during the load")
+    parser.add_argument("--forcemerge", action="store_true", default=Constant.bulk_load_forcemerge,
+                        help="force-merge the indices after a successful load")
+    args = parser.parse_args()
+
+    sink = BulkSink(
+        chunk_size=args.bulk_chunk_docs,
+        max_chunk_bytes=int(args.bulk_chunk_mb * 1024 ** 2),
+        thread_count=args.bulk_threads
+    )
+    total = replay(args.directory, sink, bulk_load_mode=args.bulk_load, forcemerge=args.forcemerge)
+    logger.info(f"Replay done: {total} documents")
+
+if __name__ == "__main__":
+    main()
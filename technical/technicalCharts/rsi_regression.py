@@ -0,0 +1,157 @@
+"""
+Regression harness for the array-backed Wilder RSI in indexer.calculate_rsi.
+
+Compares it against the original per-row iloc implementation on synthetic
+weekly series shaped like the real ones (~800 candles since 2010, late
+listings, suspended weeks, flat and one-way runs), and checks that RSI
+continued from persisted state (incremental runs) matches a full run.
+
+Run from this directory:  python rsi_regression.py
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from Constant import rsi_window
+from indexer import calculate_rsi
+
+TOLERANCE = 1e-9
+
+
+def reference_rsi(data, period):
+    """
+    Original implementation of calculate_rsi, kept verbatim as the reference.
+    """
+    data = data.copy()
+
+    valid_data = data[data["Close"].notna()].copy()
+
+    if len(valid_data) <= period:
+        data["rsi"] = np.nan
+        return data
+
+    valid_data["change"] = valid_data["Close"].diff()
+    valid_data["gain"] = valid_data["change"].clip(lower=0)
+    valid_data["loss"] = -valid_data["change"].clip(upper=0)
+
+    valid_data["avg_gain"] = np.nan
+    valid_data["avg_loss"] = np.nan
+
+    valid_data.iloc[period, valid_data.columns.get_loc("avg_gain")] = \
+        valid_data["gain"].iloc[1:period+1].mean()
+
+    valid_data.iloc[period, valid_data.columns.get_loc("avg_loss")] = \
+        valid_data["loss"].iloc[1:period+1].mean()
+
+    for i in range(period + 1, len(valid_data)):
+        valid_data.iloc[i, valid_data.columns.get_loc("avg_gain")] = (
+            (valid_data.iloc[i-1]["avg_gain"] * (period - 1)
+             + valid_data.iloc[i]["gain"]) / period
+        )
+
+        valid_data.iloc[i, valid_data.columns.get_loc("avg_loss")] = (
+            (valid_data.iloc[i-1]["avg_loss"] * (period - 1)
+             + valid_data.iloc[i]["loss"]) / period
+        )
+
+    valid_data["rs"] = valid_data["avg_gain"] / valid_data["avg_loss"]
+    valid_data["rsi"] = 100 - (100 / (1 + valid_data["rs"]))
+
+    data["rsi"] = valid_data["rsi"]
+
+    return data
+
+
+def _weekly_frame(close):
+    dates = pd.date_range("2010-01-04", periods=len(close), freq="W-MON")
+    return pd.DataFrame({"Date": dates, "Close": close})
+
+
+def build_cases(seed=7):
+    """
+    Returns {name: DataFrame} of weekly Close series.
+    """
+    rng = np.random.default_rng(seed)
+    n = 820
+    cases = {}
+
+    for i in range(5):
+        returns = rng.normal(0.002, 0.045, n)
+        cases[f"random_walk_{i}"] = _weekly_frame(100 * np.exp(np.cumsum(returns)))
+
+    # Listed mid-way: leading NaNs like a late IPO in the batch frame
+    close = 250 * np.exp(np.cumsum(rng.normal(0.003, 0.06, n)))
+    close[:500] = np.nan
+    cases["late_listing"] = _weekly_frame(close)
+
+    # Suspended weeks scattered through the history
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0, 0.03, n)))
+    close[rng.choice(n, 40, replace=False)] = np.nan
+    cases["suspended_weeks"] = _weekly_frame(close)
+
+    cases["only_up"] = _weekly_frame(np.linspace(10, 500, n))
+    cases["flat"] = _weekly_frame(np.full(n, 42.0))
+    cases["short"] = _weekly_frame(np.linspace(10, 20, rsi_window))
+    cases["just_enough"] = _weekly_frame(rng.uniform(90, 110, rsi_window + 2))
+
+    # Shuffled index labels, as after sort_values on an unsorted frame
+    frame = cases["random_walk_0"].sample(frac=1, random_state=1).sort_values("Date")
+    cases["unsorted_index"] = frame
+
+    return cases
+
+
+def check_seeded(frame, cut):
+    """
+    RSI continued from persisted state at `cut` must match the full run.
+    Returns the max abs difference over the continued candles.
+    """
+    full = calculate_rsi(frame.copy(), rsi_window)
+    seed_row = full.iloc[cut]
+    seed = {
+        "seed_date": seed_row["Date"],
+        "seed_close": seed_row["Close"],
+        "rsi_avg_gain": seed_row["rsi_avg_gain"],
+        "rsi_avg_loss": seed_row["rsi_avg_loss"],
+    }
+    tail = calculate_rsi(frame.iloc[cut - 60:].copy(), rsi_window, seed)
+    after = tail.index[tail["Date"] > seed_row["Date"]]
+    return float(np.max(np.abs(tail.loc[after, "rsi"] - full.loc[after, "rsi"])))
+
+
+def main():
+    failures = 0
+    ref_time = new_time = 0.0
+
+    cases = build_cases()
+    for name, frame in cases.items():
+        start = time.perf_counter()
+        expected = reference_rsi(frame, rsi_window)["rsi"].to_numpy(dtype=np.float64)
+        ref_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = calculate_rsi(frame.copy(), rsi_window)["rsi"].to_numpy(dtype=np.float64)
+        new_time += time.perf_counter() - start
+
+        same_nan = np.array_equal(np.isnan(expected), np.isnan(actual))
+        both = ~np.isnan(expected) & ~np.isnan(actual)
+        max_diff = float(np.max(np.abs(expected[both] - actual[both]), initial=0.0))
+        ok = same_nan and max_diff <= TOLERANCE
+        failures += not ok
+
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<16} rows={len(frame):<4} max_diff={max_diff:.3e}")
+
+    for name in ("random_walk_0", "random_walk_1", "only_up"):
+        max_diff = check_seeded(cases[name], 700)
+        ok = max_diff <= TOLERANCE
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} seeded {name:<9} max_diff={max_diff:.3e}")
+
+    print(f"reference: {ref_time:.3f}s  vectorized: {new_time:.4f}s  speedup: {ref_time / new_time:.0f}x")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import json
+
+import numpy as np
+
+from indicators import doc_fields
+from metrics import METRICS
+from partitions import partition_index
+
+# Document fields in output order, with the frame column and JSON kind (see indicators.py)
+DOC_FIELDS = [(f.name, f.frame_column, f.kind) for f in doc_fields()]
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _float_tokens(values):
+    """
+    JSON text for a float column, identical to what json.dumps emits.
+    float32 columns (low-memory runs) get the shortest text of their float32
+    value rather than the digits of its float64 widening.
+    """
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        tokens = values.astype(str).tolist()
+    else:
+        values = values.astype(np.float64, copy=False)
+        tokens = list(map(repr, values.tolist()))
+    if not np.isfinite(values).all():
+        for i in np.flatnonzero(~np.isfinite(values)).tolist():
+            tokens[i] = _dumps(values[i].item())
+    return tokens
+
+
+def _int_tokens(values):
+    values = np.asarray(values, dtype=np.float64).astype(np.int64)
+    return list(map(str, values.tolist()))
+
+
+def _bool_tokens(values):
+    return np.where(np.asarray(values, dtype=bool), "true", "false").tolist()
+
+
+def _json_tokens(values):
+    """
+    JSON text for an object column; repeated values are encoded once.
+    """
+    cache = {}
+    tokens = []
+    for value in values.tolist():
+        key = tuple(value) if isinstance(value, list) else value
+        token = cache.get(key)
+        if token is None:
+            token = cache[key] = _dumps(value)
+        tokens.append(token)
+    return tokens
+
+
+_TOKENIZERS = {
+    "float": _float_tokens,
+    "int": _int_tokens,
+    "bool": _bool_tokens,
+    "json": _json_tokens,
+}
+
+
+def _source_template(ticker, metadata=None, doc_fields=DOC_FIELDS):
+    """
+    printf-style template for one _source, with the ticker and any
+    per-ticker constant fields in `metadata` baked in.
+    """
+    metadata = metadata or {}
+    parts = ['{"ticker":', _dumps(ticker).replace("%", "%%"), ',"date":"%s"']
+    for field, _, _ in doc_fields:
+        if field in metadata:
+            parts.append(f',"{field}":' + _dumps(metadata[field]).replace("%", "%%"))
+        else:
+            parts.append(f',"{field}":%s')
+    parts.append("}")
+    return "".join(parts)
+
+
+def _serialized(docs, ticker, dates, *args):
+    return {"rows": len(dates), "docs": len(docs), "bytes": sum(len(source) for _, source in docs)}
+
+
+@METRICS.stage("serialize", count=_serialized)
+def serialize_columns(ticker, dates, columns, metadata=None, fields=None):
+    """
+    Core of the serializer: `dates` holds "YYYY-MM-DD" strings (None/NaN
+    for missing dates), `columns` maps frame column names to 1-D arrays of
+    the same length and `metadata` holds fields that are constant for the
+    ticker. Each column is converted to JSON text once, as a whole, and
+    rows are stitched together with a template.
+    Rows with Open == 0 or no date are skipped. With `fields` (document
+    field names) only those follow ticker and date, for partial updates.
+    """
+    metadata = metadata or {}
+    doc_fields = DOC_FIELDS if fields is None else [f for f in DOC_FIELDS if f[0] in fields]
+    dates = np.asarray(dates, dtype=object)
+    keep = (np.asarray(columns["Open"], dtype=np.float64) != 0) & np.array(
+        [isinstance(d, str) for d in dates.tolist()], dtype=bool
+    )
+    if not keep.any():
+        return []
+
+    dates = dates[keep].tolist()
+    tokens = [
+        _TOKENIZERS[kind](np.asarray(columns[col])[keep])
+        for field, col, kind in doc_fields
+        if field not in metadata
+    ]
+
+    template = _source_template(ticker, metadata, doc_fields)
+    id_prefix = f"{ticker}_"
+    return [
+        (id_prefix + date, (template % ((date,) + values)).encode("utf-8"))
+        for date, values in zip(dates, zip(*tokens))
+    ]
+
+
+def serialize_documents(data, ticker, fields=None, metadata=None):
+    """
+    Turn an indicator frame into (doc_id, encoded _source) pairs, without
+    building a per-row Series or dict (see serialize_columns). Fields in
+    `metadata` need no column.
+    """
+    metadata = metadata or {}
+    dates = data["Date"].dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+    columns = {
+        col: data[col].to_numpy()
+        for field, col, _ in DOC_FIELDS
+        if (fields is None or field in fields) and field not in metadata
+    }
+    columns["Open"] = data["Open"].to_numpy()
+    return serialize_columns(ticker, dates, columns, metadata, fields)
+
+
+def build_actions(index_name, data, ticker, partition_years=None, metadata=None):
+    """
+    Bulk actions for helpers.bulk with a pre-encoded _source, which the
+    client sends as-is instead of serializing a dict per document.
+    """
+    return doc_actions(index_name, serialize_documents(data, ticker, metadata=metadata), partition_years)
+
+
+def doc_actions(index_name, docs, partition_years=None):
+    """
+    Bulk actions for (doc_id, encoded _source) pairs from serialize_documents.
+    With partition_years each document goes to the partition of its date
+    (the doc id ends with it, see serialize_columns).
+    """
+    for doc_id, source in docs:
+        yield {
+            "_op_type": "index",
+            "_index": partition_index(index_name, doc_id[-10:], partition_years) if partition_years else index_name,
+            "_id": doc_id,
+            "_source": source
+        }
+
+
+def update_actions(index_name, docs, partition_years=None):
+    """
+    Partial-update bulk actions for (doc_id, encoded partial _source) pairs
+    (serialize_columns with `fields`): the documents keep every other
+    field. The pre-encoded _source is the update body
+    (see bulk_sink.expand_action).
+    """
+    for action in doc_actions(index_name, docs, partition_years):
+        action["_op_type"] = "update"
+        action["_source"] = b'{"doc":' + action["_source"] + b"}"
+        yield action
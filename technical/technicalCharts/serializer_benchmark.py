@@ -0,0 +1,142 @@
+"""
+Benchmark for the bulk-action serializer used by indexer.index_data.
+
+Builds indicator frames for synthetic weekly tickers, then times the original
+iterrows-based actions() generator against serializer.build_actions, including
+the JSON encoding of each _source, and checks that both produce the same bytes.
+
+Run from this directory:  python serializer_benchmark.py [tickers]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from elasticsearch.serializer import JsonSerializer
+
+from benchmarks import BENCHMARK_FIELDS, prepare_benchmark
+from indexer import compute_indicators
+from serializer import build_actions
+
+INDEX_NAME = "nifty_data_weekly"
+
+
+def legacy_actions(index_name, data, ticker):
+    """
+    Original actions() generator from index_data, kept as the baseline.
+    """
+    for _, r in data.iterrows():
+        if r["Open"] == 0:
+            continue
+
+        date = r["Date"].strftime("%Y-%m-%d")
+
+        yield {
+            "_op_type": "index",
+            "_index": index_name,
+            "_id": f"{ticker}_{date}",
+            "_source": {
+                "ticker": ticker,
+                "date": date,
+                "open": float(r["Open"]),
+                "close": float(r["Close"]),
+                "high": float(r["High"]),
+                "low": float(r["Low"]),
+                "volume": int(r["Volume"]),
+                "rsi": float(r["rsi"]),
+                "roc": float(r["roc"]),
+                **{field: float(r[field]) for field in BENCHMARK_FIELDS},
+                "atr": float(r["atr"]),
+                "ma_10": float(r["ma_10"]),
+                "ma_30": float(r["ma_30"]),
+                "ma_40": float(r["ma_40"]),
+                "ma_10_above_30": bool(r["ma_10_above_30"]),
+                "ma_30_above_40": bool(r["ma_30_above_40"]),
+                "ma_10_above_40": bool(r["ma_10_above_40"]),
+                "trend": r["trend"],
+                "high_52w": float(r["high_52w"]),
+                "low_52w": float(r["low_52w"]),
+                "dist_from_52w_high_pct": float(r["dist_from_52w_high_pct"]),
+                "dist_from_52w_low_pct": float(r["dist_from_52w_low_pct"]),
+                "vcp_trend_template": bool(r["vcp_trend_template"]),
+                "indices": r["indices"],
+                "type": r["type"],
+                "isCustom": r["isCustom"]
+            }
+        }
+
+
+def synthetic_ticker(rng, n=820):
+    dates = pd.date_range("2010-01-04", periods=n, freq="W-MON")
+    close = 100 * np.exp(np.cumsum(rng.normal(0.002, 0.045, n)))
+    open_ = close * (1 + rng.normal(0, 0.01, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.03, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.03, n))
+    volume = rng.integers(10_000, 5_000_000, n).astype(np.float64)
+
+    # Late listing: no prices before this point
+    listed = rng.integers(0, n // 2)
+    for arr in (open_, high, low, close, volume):
+        arr[:listed] = np.nan
+
+    return pd.DataFrame({
+        "Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume,
+        "Date": dates,
+    })
+
+
+def build_frames(count, seed=11):
+    rng = np.random.default_rng(seed)
+    nifty = synthetic_ticker(rng)[["Date", "Close"]]
+    nifty["Close"] = nifty["Close"].fillna(100.0)
+    benchmarks = (prepare_benchmark("^NSEI", "roc_nifty", nifty),)
+
+    frames = {}
+    for i in range(count):
+        ticker = f"SYN{i:04d}.NS"
+        data = synthetic_ticker(rng)
+        data["Ticker"] = ticker
+        data["type"] = ["stock"] * len(data)
+        data["isCustom"] = [False] * len(data)
+        data["indices"] = [["^NSEI", "^CNX100"]] * len(data)
+        frames[ticker] = compute_indicators(data, benchmarks)
+    return frames
+
+
+def _time(fn, frames):
+    """
+    Time building the actions and encoding each _source the way the client
+    does before sending (pre-encoded bytes pass straight through).
+    """
+    dumps = JsonSerializer().dumps
+    docs = 0
+    start = time.perf_counter()
+    for ticker, data in frames.items():
+        for action in fn(INDEX_NAME, data, ticker):
+            dumps(action["_source"])
+            docs += 1
+    return docs, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    frames = build_frames(count)
+
+    for ticker, data in frames.items():
+        legacy = list(legacy_actions(INDEX_NAME, data, ticker))
+        new = list(build_actions(INDEX_NAME, data, ticker))
+        assert [a["_id"] for a in legacy] == [a["_id"] for a in new], ticker
+        for old, cur in zip(legacy, new):
+            assert JsonSerializer().dumps(old["_source"]) == cur["_source"], old["_id"]
+
+    legacy_docs, legacy_secs = _time(legacy_actions, frames)
+    new_docs, new_secs = _time(build_actions, frames)
+
+    print(f"tickers={count} docs={new_docs} (encoded documents identical)")
+    print(f"iterrows:  {legacy_secs:.3f}s  {legacy_docs / legacy_secs:,.0f} docs/sec")
+    print(f"columnar:  {new_secs:.3f}s  {new_docs / new_secs:,.0f} docs/sec  (pre-encoded bytes)")
+    print(f"speedup:   {legacy_secs / new_secs:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
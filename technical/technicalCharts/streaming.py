@@ -0,0 +1,362 @@
+"""
+Online counterparts of the indicators in indexer.py.
+
+Each indicator keeps the few numbers it needs and updates in O(1) per
+candle, so an incremental run only feeds the candles that arrived since
+the persisted state instead of recomputing a lookback window. They follow
+the batch semantics row by row: a NaN row counts as a position in every
+window (rolling means and ROC give NaN while it is in reach), RSI skips
+NaN closes, and the 52 week extremes skip NaN values.
+
+Values agree with the batch versions up to floating point rounding (the
+rolling means keep running sums).
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+from indicators import MA_PERIODS, fingerprints
+
+NAN = float("nan")
+
+
+def _pack(values):
+    # JSON (and so Elasticsearch) has no NaN
+    return [None if v != v else v for v in values]
+
+
+def _unpack(values):
+    return [NAN if v is None else v for v in values]
+
+
+def _pct_change(value, base):
+    # pandas pct_change without fill: NaN in, NaN out; x / 0 is +-inf
+    if base == 0:
+        if value == 0 or value != value:
+            return NAN
+        return math.copysign(math.inf, value)
+    return (value / base - 1) * 100
+
+
+class RollingMean:
+    """
+    rolling(period).mean(): NaN until `period` rows were seen and while a
+    NaN is among the last `period` rows.
+    """
+
+    def __init__(self, period, values=(), total=0.0, nans=0):
+        self.period = period
+        self.values = deque(values, maxlen=period)
+        self.total = total
+        self.nans = nans
+
+    def update(self, x):
+        if len(self.values) == self.period:
+            old = self.values[0]
+            if old != old:
+                self.nans -= 1
+            else:
+                self.total -= old
+        self.values.append(x)
+        if x != x:
+            self.nans += 1
+        else:
+            self.total += x
+        return self.value()
+
+    def value(self):
+        if len(self.values) < self.period or self.nans:
+            return NAN
+        return self.total / self.period
+
+    def to_state(self):
+        return {"period": self.period, "values": _pack(self.values)}
+
+    @classmethod
+    def from_state(cls, state):
+        values = _unpack(state["values"])
+        valid = [v for v in values if v == v]
+        return cls(state["period"], values, math.fsum(valid), len(values) - len(valid))
+
+
+class EMA:
+    """
+    ewm(span, adjust=False).mean() with pandas' default ignore_na=False:
+    NaN rows repeat the last value and still decay its weight.
+    """
+
+    def __init__(self, span, value=NAN, gap=0):
+        self.span = span
+        self.alpha = 2 / (span + 1)
+        self.value = value
+        self.gap = gap
+
+    def update(self, x):
+        if x != x:
+            if self.value == self.value:
+                self.gap += 1
+            return self.value
+        if self.value != self.value:
+            self.value = x
+        else:
+            old = (1 - self.alpha) ** (self.gap + 1)
+            self.value = (old * self.value + self.alpha * x) / (old + self.alpha)
+        self.gap = 0
+        return self.value
+
+    def to_state(self):
+        return {"span": self.span, "value": _pack([self.value])[0], "gap": self.gap}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["span"], _unpack([state["value"]])[0], state["gap"])
+
+
+class ROC:
+    """
+    Percentage change over `period` rows (pct_change(period) * 100).
+    """
+
+    def __init__(self, period, values=()):
+        self.period = period
+        self.values = deque(values, maxlen=period)
+
+    def update(self, close):
+        base = self.values[0] if len(self.values) == self.period else NAN
+        self.values.append(close)
+        if base != base or close != close:
+            return NAN
+        return _pct_change(close, base)
+
+    def to_state(self):
+        return {"period": self.period, "values": _pack(self.values)}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["period"], _unpack(state["values"]))
+
+
+class WilderRSI:
+    """
+    Wilder RSI over the valid closes (see indexer.rsi_kernel): the first
+    `period` changes are averaged, later ones smoothed. NaN closes give
+    NaN and leave the state as it was.
+    """
+
+    def __init__(self, period, last_close=None, avg_gain=None, avg_loss=None, changes=()):
+        self.period = period
+        self.last_close = last_close
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+        self.changes = list(changes)
+
+    def update(self, close):
+        if close != close:
+            return NAN
+        if self.last_close is None:
+            self.last_close = close
+            return NAN
+
+        change = close - self.last_close
+        self.last_close = close
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+
+        if self.avg_gain is None:
+            self.changes.append(change)
+            if len(self.changes) < self.period:
+                return NAN
+            self.avg_gain = sum(max(c, 0.0) for c in self.changes) / self.period
+            self.avg_loss = sum(max(-c, 0.0) for c in self.changes) / self.period
+            self.changes = []
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        return self.value()
+
+    def value(self):
+        if self.avg_gain is None:
+            return NAN
+        if self.avg_loss == 0:
+            return NAN if self.avg_gain == 0 else 100.0
+        return 100 - 100 / (1 + self.avg_gain / self.avg_loss)
+
+    def to_state(self):
+        return {
+            "period": self.period, "last_close": self.last_close,
+            "avg_gain": self.avg_gain, "avg_loss": self.avg_loss, "changes": list(self.changes)
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["period"], state["last_close"], state["avg_gain"], state["avg_loss"], state["changes"])
+
+
+class ATR:
+    """
+    Mean true range over `period` rows; the true range skips NaN terms
+    like DataFrame.max(axis=1) and uses the previous row's close.
+    """
+
+    def __init__(self, period, prev_close=NAN, mean=None):
+        self.prev_close = prev_close
+        self.mean = mean or RollingMean(period)
+
+    def update(self, high, low, close):
+        terms = [t for t in (high - low, abs(high - self.prev_close), abs(low - self.prev_close)) if t == t]
+        self.prev_close = close
+        return self.mean.update(max(terms) if terms else NAN)
+
+    def to_state(self):
+        return {"prev_close": _pack([self.prev_close])[0], "mean": self.mean.to_state()}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["mean"]["period"], _unpack([state["prev_close"]])[0], RollingMean.from_state(state["mean"]))
+
+
+class RollingExtreme:
+    """
+    rolling(window, min_periods=1).max() (or .min()) with a monotonic deque
+    of (position, value): amortized O(1) per row, NaN rows skipped but
+    counted as positions.
+    """
+
+    def __init__(self, window, maximum=True, position=0, entries=()):
+        self.window = window
+        self.maximum = maximum
+        self.position = position
+        self.entries = deque(tuple(e) for e in entries)
+
+    def update(self, x):
+        self.position += 1
+        if x == x:
+            if self.maximum:
+                while self.entries and self.entries[-1][1] <= x:
+                    self.entries.pop()
+            else:
+                while self.entries and self.entries[-1][1] >= x:
+                    self.entries.pop()
+            self.entries.append((self.position, x))
+        while self.entries and self.entries[0][0] <= self.position - self.window:
+            self.entries.popleft()
+        return self.entries[0][1] if self.entries else NAN
+
+    def to_state(self):
+        # Positions relative to the last row keep the numbers small
+        return {
+            "window": self.window, "maximum": self.maximum,
+            "entries": [[p - self.position, v] for p, v in self.entries]
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["window"], state["maximum"], 0, state["entries"])
+
+
+class IndicatorStream:
+    """
+    Every indicator of compute_indicators for one ticker on `timeframe`,
+    one candle at a time. update() returns the raw indicator values of the
+    candle (NaN where the batch version has NaN before its defaults are
+    filled); screens and defaults are applied by indexer.stream_indicators.
+    """
+
+    def __init__(self, timeframe, components=None):
+        self.params = self.params_of(timeframe)
+        self.components = components or {
+            "atr": ATR(timeframe.atr_period),
+            "rsi": WilderRSI(timeframe.rsi_window),
+            "roc": ROC(timeframe.roc_period),
+            **{f"ma_{p}": RollingMean(p) for p in MA_PERIODS},
+            "high_52w": RollingExtreme(timeframe.high_low_window, maximum=True),
+            "low_52w": RollingExtreme(timeframe.high_low_window, maximum=False),
+        }
+
+    @staticmethod
+    def params_of(timeframe):
+        # Any indicator change (version or parameters) invalidates persisted streams
+        return {"timeframe": timeframe.name, "indicators": fingerprints(timeframe)}
+
+    def update(self, high, low, close):
+        c = self.components
+        rsi = c["rsi"]
+        out = {
+            "atr": c["atr"].update(high, low, close),
+            "rsi": rsi.update(close),
+            "roc": c["roc"].update(close),
+            **{f"ma_{p}": c[f"ma_{p}"].update(close) for p in MA_PERIODS},
+            "high_52w": c["high_52w"].update(high),
+            "low_52w": c["low_52w"].update(low),
+        }
+        valid = close == close and rsi.avg_gain is not None
+        out["rsi_avg_gain"] = rsi.avg_gain if valid else NAN
+        out["rsi_avg_loss"] = rsi.avg_loss if valid else NAN
+        return out
+
+    @classmethod
+    def from_history(cls, timeframe, high, low, close, avg_gain, avg_loss, row):
+        """
+        Stream as of `row` of computed history arrays: each windowed
+        indicator replays the rows it can still see, RSI continues from
+        the Wilder averages of `row` (which must be set).
+        """
+        def tail(values, n):
+            return values[max(0, row - n + 1):row + 1].tolist()
+
+        stream = cls(timeframe)
+        c = stream.components
+        # One more row for the previous close of the first true range
+        n = timeframe.atr_period + 1
+        for h, l, cl in zip(tail(high, n), tail(low, n), tail(close, n)):
+            c["atr"].update(h, l, cl)
+        for name, n in [("roc", timeframe.roc_period)] + [(f"ma_{p}", p) for p in MA_PERIODS]:
+            for value in tail(close, n):
+                c[name].update(value)
+        for name, values in (("high_52w", high), ("low_52w", low)):
+            for value in tail(values, timeframe.high_low_window):
+                c[name].update(value)
+        c["rsi"] = WilderRSI(timeframe.rsi_window, float(close[row]), float(avg_gain[row]), float(avg_loss[row]))
+        return stream
+
+    def to_state(self):
+        return {"params": self.params, **{name: c.to_state() for name, c in self.components.items()}}
+
+    @classmethod
+    def from_state(cls, state, timeframe):
+        """
+        Stream from a persisted state; None when it was written with other
+        indicator settings than `timeframe` has now.
+        """
+        if state is None or state.get("params") != cls.params_of(timeframe):
+            return None
+        components = {
+            "atr": ATR.from_state(state["atr"]),
+            "rsi": WilderRSI.from_state(state["rsi"]),
+            "roc": ROC.from_state(state["roc"]),
+            **{f"ma_{p}": RollingMean.from_state(state[f"ma_{p}"]) for p in MA_PERIODS},
+            "high_52w": RollingExtreme.from_state(state["high_52w"]),
+            "low_52w": RollingExtreme.from_state(state["low_52w"]),
+        }
+        return cls(timeframe, components)
+
+
+def stream_arrays(stream, high, low, close):
+    """
+    Feeds the rows of float arrays to `stream`. Returns ({field: array} of
+    the raw values, {row: stream state after it}) with the state of the
+    last two rows that have RSI averages, which index_state needs to seed
+    the next run.
+    """
+    rows, snapshots = [], {}
+    for i, (h, l, c) in enumerate(zip(high.tolist(), low.tolist(), close.tolist())):
+        out = stream.update(h, l, c)
+        rows.append(out)
+        if out["rsi_avg_gain"] == out["rsi_avg_gain"]:
+            if len(snapshots) == 2:
+                del snapshots[min(snapshots)]
+            snapshots[i] = stream.to_state()
+
+    fields = rows[0] if rows else {}
+    columns = {field: np.array([r[field] for r in rows], dtype=np.float64) for field in fields}
+    return columns, snapshots
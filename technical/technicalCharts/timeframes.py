@@ -0,0 +1,44 @@
+from typing import NamedTuple, Optional
+
+import Constant
+
+
+class Timeframe(NamedTuple):
+    """
+    One candle timeframe built from the daily download: its resample
+    anchor (see data_fetcher.period_start), target indices and indicator
+    windows, all counted in candles of this timeframe. With partition_years
+    the candle index is an alias over partitions (see partitions.py).
+    """
+    name: str
+    anchor: str
+    index_name: str
+    state_index_name: str
+    rsi_window: int
+    atr_period: int
+    roc_period: int
+    high_low_window: int
+    partition_years: Optional[int] = None
+
+
+def get_timeframe(name):
+    """
+    Timeframe `name` from Constant.timeframes; windows it does not set
+    fall back to the global rsi_window / atr_period / roc_period.
+    """
+    config = Constant.timeframes[name]
+    return Timeframe(
+        name=name,
+        anchor=config["anchor"],
+        index_name=config["index_name"],
+        state_index_name=config["state_index_name"],
+        rsi_window=config.get("rsi_window", Constant.rsi_window),
+        atr_period=config.get("atr_period", Constant.atr_period),
+        roc_period=config.get("roc_period", Constant.roc_period),
+        high_low_window=config["high_low_window"],
+        partition_years=config.get("partition_years"),
+    )
+
+
+# The original timeframe; incremental runs and single-ticker helpers default to it
+WEEKLY = get_timeframe("weekly")